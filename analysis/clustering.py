@@ -3,18 +3,124 @@ import pandas as pd
 import numpy as np
 import hdbscan
 import folium
+import json
 import webbrowser
 import os
+import sys
 
 from loguru import logger
 from yaspin import yaspin
-from tqdm import tqdm
 from time import time
 from shapely.geometry import MultiPoint, mapping
+from point_map import point_layer
+
+sys.path.append("./model")
 
 CURRENT_DIR = os.getcwd()
 
 
+def make_clusterer(min_cluster_size, min_samples, alpha, method, cache_dir):
+    """ HDBSCAN over radians with haversine distances. With a cache_dir the
+        single linkage tree, which depends on the points, min_samples and
+        alpha but not on min_cluster_size or the selection method, is
+        cached on disk and reused by later fits.
+    """
+    from joblib import Memory
+
+    return hdbscan.HDBSCAN(
+        min_cluster_size=min_cluster_size,
+        min_samples=min_samples,
+        alpha=alpha,
+        metric="haversine",
+        cluster_selection_method=method,
+        memory=Memory(cache_dir, verbose=0),
+    )
+
+
+def cluster_summary(clusterer):
+    labels = clusterer.labels_
+    clustered = labels[labels != -1]
+    sizes = np.bincount(clustered) if clustered.size else np.array([0])
+    return {
+        "clusters": int(labels.max() + 1),
+        "noise_fraction": float((labels == -1).mean()),
+        "largest_cluster": int(sizes.max()),
+        "median_cluster": float(np.median(sizes)),
+        "mean_persistence": float(np.mean(clusterer.cluster_persistence_))
+        if len(clusterer.cluster_persistence_)
+        else 0.0,
+    }
+
+
+def cluster_hulls(points, labels, hull="convex", ratio=0.3, buffer=0.0):
+    """ One hull per cluster label (noise excluded) over (lon, lat) points.
+        Concave hulls keep ratio of the way from convex toward the tightest
+        hull; a buffer in degrees pads each hull.
+    """
+    clustered = labels != -1
+    points, labels = points[clustered], labels[clustered]
+    cluster_labels, indices = np.unique(labels, return_inverse=True)
+    order = np.argsort(indices, kind="stable")
+    points, indices = points[order], indices[order]
+    sizes = np.bincount(indices)
+    try:
+        # Shapely 2 builds and hulls every cluster in one vectorized call.
+        import shapely
+
+        multipoints = shapely.multipoints(points, indices=indices)
+        if hull == "concave":
+            hulls = shapely.concave_hull(multipoints, ratio=ratio)
+        else:
+            hulls = shapely.convex_hull(multipoints)
+        if buffer:
+            hulls = shapely.buffer(hulls, buffer)
+    except AttributeError:
+        if hull == "concave":
+            raise click.UsageError("Concave hulls need shapely 2.")
+        groups = np.split(points, np.cumsum(sizes)[:-1])
+        hulls = [MultiPoint(group).convex_hull for group in groups]
+        if buffer:
+            hulls = [h.buffer(buffer) for h in hulls]
+    return cluster_labels, sizes, list(hulls)
+
+
+def hull_features(cluster_labels, sizes, hulls):
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {"cluster_label": int(label), "size": int(size)},
+                "geometry": mapping(hull),
+            }
+            for label, size, hull in zip(cluster_labels, sizes, hulls)
+        ],
+    }
+
+
+def explore(coordinates, sizes, min_samples, alpha, cache_dir):
+    """ Clusters for every min_cluster_size and selection method. Only the
+        first fit builds the tree; the rest re-extract clusters from it.
+    """
+    rows = []
+    for min_cluster_size in sizes:
+        for method in ["eom", "leaf"]:
+            start = time()
+            clusterer = make_clusterer(
+                min_cluster_size, min_samples, alpha, method, cache_dir
+            )
+            clusterer.fit(coordinates)
+            rows.append(
+                {
+                    "min_cluster_size": min_cluster_size,
+                    "method": method,
+                    **cluster_summary(clusterer),
+                    "seconds": time() - start,
+                }
+            )
+    return pd.DataFrame(rows)
+
+
 @click.command()
 @click.argument("sightings_file", type=click.File("r"))
 @click.option("--min-cluster-size", type=int, default=5)
@@ -26,40 +132,123 @@ CURRENT_DIR = os.getcwd()
     type=str,
     default="data/visualizations/sighting_cluster_map.html",
 )
+@click.option(
+    "--cache-dir", type=click.Path(), default="data/interim/hdbscan_cache"
+)
+@click.option(
+    "--explore",
+    "explore_sizes",
+    type=str,
+    default=None,
+    help="Comma separated min cluster sizes to compare with both methods "
+    "instead of drawing the map.",
+)
+@click.option(
+    "--summary-file",
+    type=click.Path(),
+    default="data/processed/cluster_exploration.csv",
+)
+@click.option(
+    "--hull", type=click.Choice(["convex", "concave"]), default="convex"
+)
+@click.option(
+    "--concave-ratio",
+    type=float,
+    default=0.3,
+    help="0 is the tightest concave hull, 1 the convex hull.",
+)
+@click.option(
+    "--buffer", type=float, default=0.0, help="Pad hulls by this many degrees."
+)
+@click.option(
+    "--labels-file",
+    type=click.Path(),
+    default=None,
+    help="Write each sighting's cluster label (.parquet, .feather or .csv).",
+)
+@click.option(
+    "--hulls-file",
+    type=click.Path(),
+    default=None,
+    help="Write the cluster hulls as GeoJSON.",
+)
+@click.option("--no-map", is_flag=True, default=False)
+@click.option(
+    "--open", "open_map", is_flag=True, help="Open the map in a browser."
+)
 def main(
-    sightings_file, min_cluster_size, min_samples, alpha, method, output_file
+    sightings_file,
+    min_cluster_size,
+    min_samples,
+    alpha,
+    method,
+    output_file,
+    cache_dir,
+    explore_sizes,
+    summary_file,
+    hull,
+    concave_ratio,
+    buffer,
+    labels_file,
+    hulls_file,
+    no_map,
+    open_map,
 ):
     sightings = pd.read_csv(sightings_file).query("~latitude.isnull()")
-    clusterer = hdbscan.HDBSCAN(
-        min_cluster_size=min_cluster_size,
-        min_samples=min_samples,
-        alpha=alpha,
-        metric="haversine",
-        cluster_selection_method=method,
+    coordinates = sightings[["latitude", "longitude"]].values * (np.pi / 180)
+
+    if explore_sizes is not None:
+        sizes = [int(size) for size in explore_sizes.split(",")]
+        if min_samples is None:
+            # HDBSCAN defaults min_samples to min_cluster_size, which would
+            # change the tree for every size.
+            min_samples = min(sizes)
+            logger.info(f"Fixing min_samples at {min_samples}.")
+        summary = explore(coordinates, sizes, min_samples, alpha, cache_dir)
+        logger.info(
+            f"Cluster sizes:\n{summary.round(3).to_string(index=False)}"
+        )
+        logger.info(f"Writing the summary to {summary_file}.")
+        summary.to_csv(summary_file, index=False)
+        return
+
+    clusterer = make_clusterer(
+        min_cluster_size, min_samples, alpha, method, cache_dir
     )
     logger.info("Performing clustering.")
     start = time()
     with yaspin(text="👣 Building clusters 👣", color="cyan"):
-        clusterer.fit(
-            sightings[["latitude", "longitude"]].values * (np.pi / 180)
-        )
+        clusterer.fit(coordinates)
     logger.info(
         f"Found {clusterer.labels_.max()} clusters in {time() - start:.3f}s."
     )
     sightings.loc[:, "cluster_label"] = clusterer.labels_
 
-    logger.info("Drawing cluster polygons.")
+    logger.info(f"Drawing {hull} cluster hulls.")
     start = time()
-    cluster_polygons = []
-    for label, cluster_frame in tqdm(
-        sightings.query("cluster_label != -1").groupby("cluster_label"),
-        total=clusterer.labels_.max(),
-    ):
-        cluster_points = MultiPoint(
-            cluster_frame[["longitude", "latitude"]].values
+    cluster_geojson = hull_features(
+        *cluster_hulls(
+            sightings[["longitude", "latitude"]].values,
+            clusterer.labels_,
+            hull,
+            concave_ratio,
+            buffer,
         )
-        cluster_polygons.append(cluster_points.convex_hull)
-    logger.info(f"Cluster polygons drawn in {time() - start:.3f}s.")
+    )
+    logger.info(f"Cluster hulls drawn in {time() - start:.3f}s.")
+
+    if labels_file is not None:
+        from interchange import write_frame
+
+        logger.info(f"Writing cluster labels to {labels_file}.")
+        write_frame(sightings, labels_file)
+    if hulls_file is not None:
+        logger.info(f"Writing cluster hulls to {hulls_file}.")
+        with open(hulls_file, "w") as f:
+            json.dump(cluster_geojson, f)
+
+    if no_map:
+        return
 
     # Now draw the map.
     logger.info("Drawing the map.")
@@ -68,20 +257,14 @@ def main(
         location=map_center, zoom_start=5, tiles="cartodbpositron"
     )
 
-    for _, row in sightings.iterrows():
-        folium.CircleMarker(
-            [row.latitude, row.longitude], radius=1, opacity=0.75
-        ).add_to(sighting_cluster_map)
-
-    cluster_polygon_geojson = {"type": "FeatureCollection", "features": []}
-    for polygon in cluster_polygons:
-        cluster_polygon_geojson["features"].append(
-            {"type": "Feature", "properties": {}, "geometry": mapping(polygon)}
-        )
+    point_layer(
+        sightings.latitude.values, sightings.longitude.values
+    ).add_to(sighting_cluster_map)
 
-    folium.GeoJson(cluster_polygon_geojson).add_to(sighting_cluster_map)
+    folium.GeoJson(cluster_geojson).add_to(sighting_cluster_map)
     sighting_cluster_map.save(output_file)
-    webbrowser.open(f"file://{CURRENT_DIR}/{output_file}")
+    if open_map:
+        webbrowser.open(f"file://{CURRENT_DIR}/{output_file}")
 
 
 if __name__ == "__main__":
@@ -1,80 +1,162 @@
 import click
 import json
+import os
+import sys
+import numpy as np
 import pandas as pd
 import folium
 import branca
 
+from branca.element import MacroElement, Template
 from h3 import h3
-from shapely.geometry import mapping, shape
 
+sys.path.append("./model")
 
-@click.command()
-@click.argument("data_file", type=click.File("r"))
-@click.argument("polygon_file", type=click.File("r"))
-@click.option("--resolution", type=int, default=4)
-@click.option("--output-file", type=str, default="sasquatch_hex.html")
-def main(data_file, polygon_file, resolution, output_file):
-    data = pd.read_csv(data_file).query("~latitude.isnull()")
-    # Index the data by h3. Not the most efficient way to do it but it's fast
-    # enough IMO.
-    data.loc[:, "h3_index"] = [
-        h3.geo_to_h3(row.latitude, row.longitude, resolution)
-        for _, row in data.iterrows()
-    ]
 
-    # Read in the US states polygons.
-    us_states = shape(json.load(polygon_file))
-    state_hexes = set()
-
-    # Polyfill each state and add it to the big list of h3 indexes.
-    for geometry in us_states:
-        state_hexes |= h3.polyfill(
-            mapping(geometry), resolution, geo_json_conformant=True
-        )
-
-    all_hexes = state_hexes | set(data.h3_index)
-    # Now reindex the counted sightings by hex address and fill the empties
-    # with zeros.
-    grouped_sightings = (
-        data.groupby("h3_index")
-        .agg({"date": "count"})
-        .reindex(list(all_hexes), fill_value=0)
+class HexagonLayer(MacroElement):
+    """ A GeoJSON layer styled in the browser from each feature's
+        precomputed fill color, so the page carries one style function
+        instead of a style dict per feature.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = L.geoJson({{ this.data }}, {
+            style: function(feature) {
+                return {
+                    fillColor: feature.properties.fill,
+                    color: "gray",
+                    weight: 0.1,
+                    fillOpacity: 0.5
+                };
+            },
+            onEachFeature: function(feature, layer) {
+                layer.bindTooltip(
+                    feature.properties.hex_address
+                    + ": " + feature.properties.count
+                );
+            }
+        }).addTo({{ this._parent.get_name() }});
+        {% endmacro %}
+        """
     )
 
-    geo_json = {"type": "FeatureCollection", "features": []}
+    def __init__(self, geo_json):
+        super().__init__()
+        self._name = "HexagonLayer"
+        self.data = json.dumps(geo_json, separators=(",", ":"))
+
+
+def hex_counts(index, hexes, resolution):
+    """ Points per hexagon from a SightingIndex for every hexagon in hexes
+        plus any the points fall in outside of them.
+    """
+    counts = index.to_frame(resolution).set_index("hex_address")["count"]
+    all_hexes = sorted(set(hexes) | set(counts.index))
+    return counts.reindex(all_hexes, fill_value=0)
+
+
+def quantized_boundaries(hex_addresses, precision):
+    """ Boundary rings rounded to precision decimal places; 4 places is
+        about 10 meters, far finer than any hexagon drawn here.
+    """
+    rings = [
+        h3.h3_to_geo_boundary(address, geo_json=True)
+        for address in hex_addresses
+    ]
+    # Round every vertex at once, then split back into rings.
+    lengths = np.array([len(ring) for ring in rings])
+    vertices = np.round(np.concatenate(rings), precision)
+    return np.split(vertices, np.cumsum(lengths)[:-1])
+
 
-    for h3_address, row in grouped_sightings.iterrows():
-        hexagon = h3.h3_to_geo_boundary(h3_address, geo_json=True)
-        geo_json["features"].append(
+def hexagon_features(counts, colors, precision):
+    boundaries = quantized_boundaries(counts.index, precision)
+    return {
+        "type": "FeatureCollection",
+        "features": [
             {
                 "type": "Feature",
-                "geometry": {"type": "Polygon", "coordinates": [hexagon]},
+                "geometry": {
+                    "type": "Polygon",
+                    "coordinates": [boundary.tolist()],
+                },
                 "properties": {
-                    "hex_address": h3_address,
-                    "count": int(row.date),
+                    "hex_address": address,
+                    "count": int(count),
+                    "fill": color,
                 },
             }
-        )
+            for address, count, color, boundary in zip(
+                counts.index, counts.values, colors, boundaries
+            )
+        ],
+    }
 
-    # Now it's map time.
-    map_center = [data["latitude"].mean(), data["longitude"].mean()]
+
+def hex_map(index, hexes, resolution, center, precision=4):
+    """ Map of point counts per hexagon over hexes. """
+    counts = hex_counts(index, hexes, resolution)
     colormap = branca.colormap.linear.YlOrRd_09.scale(
-        grouped_sightings.date.min(), grouped_sightings.date.max()
+        counts.min(), counts.max()
     )
-    m = folium.Map(location=map_center, zoom_start=5, tiles="cartodbpositron")
-
-    folium.GeoJson(
-        geo_json,
-        tooltip=folium.GeoJsonTooltip(["hex_address", "count"]),
-        style_function=lambda x: {
-            "fillColor": colormap(x["properties"]["count"]),
-            "color": "gray",
-            "weight": 0.1,
-            "fillOpacity": 0.5,
-        },
-    ).add_to(m)
+    # One colormap call per distinct count rather than per hexagon.
+    palette = {count: colormap(count) for count in np.unique(counts.values)}
+    colors = [palette[count] for count in counts.values]
+
+    m = folium.Map(location=center, zoom_start=5, tiles="cartodbpositron")
+    HexagonLayer(hexagon_features(counts, colors, precision)).add_to(m)
     colormap.add_to(m)
-    m.save(output_file)
+    return m
+
+
+@click.command()
+@click.argument("data_file", type=click.File("r"))
+@click.argument("polygon_file", type=click.File("r"))
+@click.option("--resolution", type=int, default=4)
+@click.option("--output-file", type=str, default="sasquatch_hex.html")
+@click.option(
+    "--precision",
+    type=int,
+    default=4,
+    help="Decimal places kept in hexagon coordinates.",
+)
+@click.option("--workers", type=int, default=os.cpu_count())
+@click.option(
+    "--tile-size",
+    type=float,
+    default=None,
+    help="Polygons wider than this many degrees are split into tiles.",
+)
+@click.option(
+    "--cache-dir", type=click.Path(), default="data/interim/polyfill_cache"
+)
+def main(
+    data_file,
+    polygon_file,
+    resolution,
+    output_file,
+    precision,
+    workers,
+    tile_size,
+    cache_dir,
+):
+    from polyfill import TILE_SIZE, cached_polyfill
+    from sighting_index import cached_sighting_index
+
+    data = pd.read_csv(data_file).query("~latitude.isnull()")
+    center = [data["latitude"].mean(), data["longitude"].mean()]
+    # Both share their caches with us_hexagons.py.
+    index = cached_sighting_index(data_file.name)
+    hexes = cached_polyfill(
+        polygon_file.read(),
+        resolution,
+        workers,
+        TILE_SIZE if tile_size is None else tile_size,
+        cache_dir,
+    )
+    hex_map(index, hexes, resolution, center, precision).save(output_file)
 
 
 if __name__ == "__main__":
@@ -1,25 +1,85 @@
 import click
+import json
 import folium
+import numpy as np
 import pandas as pd
 
+from branca.element import MacroElement, Template
 
-@click.command()
-@click.argument("data_file", type=click.File("r"))
-@click.option("--output-file", type=str, default="sasquatch_point.html")
-def main(data_file, output_file):
-    data = pd.read_csv(data_file).query("~latitude.isnull()")
+
+class PointLayer(MacroElement):
+    """ Every point as one canvas-rendered layer built from a flat
+        coordinate array, instead of a CircleMarker object (and block of
+        JavaScript) per row.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = (function(coordinates) {
+            var renderer = L.canvas({padding: 0.5});
+            var layer = L.layerGroup();
+            for (var i = 0; i < coordinates.length; i += 2) {
+                L.circleMarker([coordinates[i], coordinates[i + 1]], {
+                    renderer: renderer,
+                    radius: {{ this.radius }},
+                    opacity: {{ this.opacity }}
+                }).addTo(layer);
+            }
+            return layer;
+        })({{ this.data }}).addTo({{ this._parent.get_name() }});
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, latitudes, longitudes, precision=5, radius=1):
+        super().__init__()
+        self._name = "PointLayer"
+        self.radius = radius
+        self.opacity = 0.75
+        coordinates = np.round(
+            np.column_stack([latitudes, longitudes]), precision
+        )
+        self.data = json.dumps(coordinates.ravel().tolist())
+
+
+def point_layer(latitudes, longitudes, precision=5, cluster=False):
+    """ One layer for all the points, optionally clustered. """
+    if cluster:
+        from folium.plugins import FastMarkerCluster
+
+        return FastMarkerCluster(
+            np.round(np.column_stack([latitudes, longitudes]), precision)
+        )
+    return PointLayer(latitudes, longitudes, precision)
+
+
+def point_map(data, precision=5, cluster=False):
     map_center = [data["latitude"].mean(), data["longitude"].mean()]
     sasquatch_map = folium.Map(
         location=map_center, zoom_start=5, tiles="cartodbpositron"
     )
+    point_layer(
+        data.latitude.values, data.longitude.values, precision, cluster
+    ).add_to(sasquatch_map)
+    return sasquatch_map
+
 
-    for _, row in data.iterrows():
-        folium.CircleMarker(
-            [row.latitude, row.longitude],
-            radius=1,
-            opacity=0.75
-        ).add_to(sasquatch_map)
-    sasquatch_map.save(output_file)
+@click.command()
+@click.argument("data_file", type=click.File("r"))
+@click.option("--output-file", type=str, default="sasquatch_point.html")
+@click.option(
+    "--cluster", is_flag=True, default=False, help="Cluster nearby points."
+)
+@click.option(
+    "--precision",
+    type=int,
+    default=5,
+    help="Decimal places kept in point coordinates.",
+)
+def main(data_file, output_file, cluster, precision):
+    data = pd.read_csv(data_file).query("~latitude.isnull()")
+    point_map(data, precision, cluster).save(output_file)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,207 @@
+import click
+import json
+import os
+import subprocess
+import sys
+
+from loguru import logger
+from time import perf_counter
+
+sys.path.append("./model")
+
+
+_worker_args = None
+
+
+def _init_worker(*args):
+    global _worker_args
+    _worker_args = args
+
+
+def _render_point_map(name, output_file):
+    from point_map import point_map
+
+    frames = _worker_args[0]
+    point_map(frames[name]).save(output_file)
+
+
+def _render_hex_map(name, output_file):
+    from hex_map import hex_map
+
+    frames, indexes, hexes, resolution = _worker_args
+    data = frames[name]
+    center = [data["latitude"].mean(), data["longitude"].mean()]
+    hex_map(indexes[name], hexes, resolution, center).save(output_file)
+
+
+def _render_svl(svl_file, dataset_file, output_file):
+    subprocess.run(
+        [
+            "svl",
+            svl_file,
+            "--dataset",
+            f"bigfoot={dataset_file}",
+            "--output-file",
+            output_file,
+            # svl opens a browser unless told not to.
+            "--no-browser",
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+RENDERERS = {
+    "point_map": _render_point_map,
+    "hex_map": _render_hex_map,
+    "svl": _render_svl,
+}
+
+
+def _render(job):
+    """ Renders one output, returning its timing instead of raising so one
+        failure doesn't stop the batch.
+    """
+    kind, args, output_file = job
+    start = perf_counter()
+    error = None
+    try:
+        RENDERERS[kind](*args, output_file)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return {
+        "output_file": output_file,
+        "kind": kind,
+        "seconds": perf_counter() - start,
+        "error": error,
+    }
+
+
+def render_jobs(output_dir, raw_training_data, training_data):
+    def output(name):
+        return os.path.join(output_dir, f"{name}.html")
+
+    return [
+        ("point_map", ("sightings",), output("sightings_point_map")),
+        ("point_map", ("not_sightings",), output("not_sightings_point_map")),
+        ("hex_map", ("sightings",), output("sighting_hex_map")),
+        ("hex_map", ("not_sightings",), output("not_sighting_hex_map")),
+        (
+            "svl",
+            ("analysis/raw_training_data.svl", raw_training_data),
+            output("raw_training_data"),
+        ),
+        (
+            "svl",
+            ("analysis/training_data.svl", training_data),
+            output("training_data"),
+        ),
+    ]
+
+
+@click.command()
+@click.argument("sightings_file", type=click.Path(exists=True))
+@click.argument("not_sightings_file", type=click.Path(exists=True))
+@click.argument("polygon_file", type=click.Path(exists=True))
+@click.option(
+    "--raw-training-data",
+    type=click.Path(),
+    default="data/processed/raw_training_data.csv",
+)
+@click.option(
+    "--training-data",
+    type=click.Path(),
+    default="data/processed/training_data.csv",
+)
+@click.option(
+    "--output-dir", type=click.Path(), default="data/visualizations"
+)
+@click.option("--resolution", type=int, default=4)
+@click.option("--workers", type=int, default=os.cpu_count())
+@click.option(
+    "--tile-size",
+    type=float,
+    default=None,
+    help="Polygons wider than this many degrees are split into tiles.",
+)
+@click.option(
+    "--cache-dir", type=click.Path(), default="data/interim/polyfill_cache"
+)
+@click.option(
+    "--report-file",
+    type=click.Path(),
+    default="data/visualizations/render_times.json",
+)
+def main(
+    sightings_file,
+    not_sightings_file,
+    polygon_file,
+    raw_training_data,
+    training_data,
+    output_dir,
+    resolution,
+    workers,
+    tile_size,
+    cache_dir,
+    report_file,
+):
+    """ Renders every map and svl chart in parallel without opening a
+        browser. The point frames, sighting indexes and polyfilled US are
+        loaded once and shared with the workers.
+    """
+    import pandas as pd
+
+    from multiprocessing import Pool
+
+    from interchange import read_frame
+    from polyfill import TILE_SIZE, cached_polyfill
+    from sighting_index import cached_sighting_index
+
+    start = perf_counter()
+    files = {"sightings": sightings_file, "not_sightings": not_sightings_file}
+    frames = {
+        name: read_frame(path).query("~latitude.isnull()")
+        for name, path in files.items()
+    }
+    indexes = {
+        name: cached_sighting_index(path) for name, path in files.items()
+    }
+    with open(polygon_file, "r") as f:
+        hexes = cached_polyfill(
+            f.read(),
+            resolution,
+            workers,
+            TILE_SIZE if tile_size is None else tile_size,
+            cache_dir,
+        )
+    logger.info(f"Loaded shared inputs in {perf_counter() - start:.2f}s.")
+
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = render_jobs(output_dir, raw_training_data, training_data)
+    logger.info(f"Rendering {len(jobs)} outputs on {workers} workers.")
+    start = perf_counter()
+    with Pool(
+        min(workers, len(jobs)),
+        _init_worker,
+        (frames, indexes, hexes, resolution),
+    ) as pool:
+        results = pool.map(_render, jobs, chunksize=1)
+    elapsed = perf_counter() - start
+
+    report = pd.DataFrame(results)
+    logger.info(f"Render times:\n{report.round(2).to_string(index=False)}")
+    logger.info(
+        f"Rendered in {elapsed:.2f}s wall clock, "
+        f"{report.seconds.sum():.2f}s of render time."
+    )
+    with open(report_file, "w") as f:
+        json.dump({"wall_seconds": elapsed, "outputs": results}, f, indent=2)
+
+    failed = report.error.notnull().sum()
+    if failed:
+        logger.error(f"{failed} outputs failed to render.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
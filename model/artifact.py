@@ -0,0 +1,185 @@
+import json
+import os
+import numpy as np
+
+from h3 import h3
+
+
+ARTIFACT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+# The extension picks xgboost's format; JSON is readable by every version
+# since 1.0.
+BOOSTER_FILE = "booster.json"
+HISTORY_FILE = "history.npz"
+PRECIP_FILL_VALUE = "no_precipitation"
+
+
+def export_artifact(pipeline, resolution, artifact_dir):
+    """ Writes the fitted pipeline as a booster in native xgboost format plus
+        a JSON manifest holding everything the feature pipeline learned.
+    """
+    # Only the export side needs the training code.
+    from assemble import RAW_FEATURES
+    from features import (
+        get_features,
+        get_geospatial_discretizer,
+        get_one_hot_precip,
+        get_sighting_history,
+    )
+
+    feature_pipeline = pipeline.steps[0][1]
+    hex_frame = get_geospatial_discretizer(feature_pipeline).hex_frame
+
+    os.makedirs(artifact_dir, exist_ok=True)
+    pipeline.steps[-1][1].get_booster().save_model(
+        os.path.join(artifact_dir, BOOSTER_FILE)
+    )
+
+    manifest = {
+        "version": ARTIFACT_VERSION,
+        "booster": BOOSTER_FILE,
+        "resolution": resolution,
+        "raw_features": RAW_FEATURES,
+        "features": get_features(feature_pipeline),
+        "precip_vocabulary": [
+            str(p) for p in get_one_hot_precip(feature_pipeline)
+        ],
+        "precip_fill_value": PRECIP_FILL_VALUE,
+        "hex_counts": {
+            hex_address: int(count)
+            for hex_address, count in hex_frame["h3"].items()
+        },
+    }
+    history = get_sighting_history(feature_pipeline)
+    if history is not None:
+        history.cube.save(os.path.join(artifact_dir, HISTORY_FILE))
+        manifest["history"] = {
+            "file": HISTORY_FILE,
+            "window_months": history.window_months,
+        }
+    with open(os.path.join(artifact_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f)
+
+    return manifest
+
+
+class PortableModel:
+    """ Scores raw feature columns with the exported booster. Only needs
+        numpy, h3 and xgboost - no sklearn, pandas or pickles.
+    """
+
+    def __init__(self, manifest, booster, history=None):
+        self.manifest = manifest
+        self.booster = booster
+        # The SightingCube for recent_sightings, if the model uses it.
+        self.history = history
+        self.resolution = manifest["resolution"]
+        self.raw_features = manifest["raw_features"]
+        self.features = manifest["features"]
+        self.precip_vocabulary = manifest["precip_vocabulary"]
+        self.precip_fill_value = manifest["precip_fill_value"]
+        self.hex_counts = manifest["hex_counts"]
+        # Everything after date, lat, lon and precip type is passed through.
+        self.passthrough = self.raw_features[4:]
+
+    def _month(self, dates):
+        months = (
+            np.asarray(dates)
+            .astype("datetime64[D]")
+            .astype("datetime64[M]")
+            .astype(int)
+        )
+        return months % 12 + 1
+
+    def _nearby_sightings(self, latitudes, longitudes):
+        return np.array(
+            [
+                self.hex_counts.get(
+                    h3.geo_to_h3(lat, lon, self.resolution), 0
+                )
+                for lat, lon in zip(latitudes, longitudes)
+            ],
+            dtype=float,
+        )
+
+    def _recent_sightings(self, columns):
+        if self.history is None:
+            return []
+        return [
+            self.history.trailing_counts(
+                columns["date"],
+                columns["latitude"],
+                columns["longitude"],
+                self.manifest["history"]["window_months"],
+            ).astype(float)
+        ]
+
+    def _one_hot_precip(self, precip_types):
+        precip = np.array(
+            [
+                self.precip_fill_value
+                if (p is None or (isinstance(p, float) and np.isnan(p)))
+                else p
+                for p in precip_types
+            ],
+            dtype=object,
+        )
+        # Unknown categories come out as all zeros.
+        return np.column_stack(
+            [precip == category for category in self.precip_vocabulary]
+        ).astype(float)
+
+    def transform(self, columns):
+        """ Builds the feature matrix in the order the booster was trained
+            on. columns is anything indexable by column name, such as a data
+            frame or a dict of arrays.
+        """
+        return np.column_stack(
+            [
+                self._month(columns["date"]),
+                self._nearby_sightings(
+                    columns["latitude"], columns["longitude"]
+                ),
+            ]
+            + self._recent_sightings(columns)
+            + [
+                self._one_hot_precip(columns["precip_type"]),
+            ]
+            + [
+                np.asarray(columns[feature], dtype=float)
+                for feature in self.passthrough
+            ]
+        )
+
+    def predict_proba(self, columns):
+        from xgboost import DMatrix
+
+        probability = self.booster.predict(
+            DMatrix(self.transform(columns), missing=np.nan)
+        )
+        return np.column_stack([1 - probability, probability])
+
+
+def load_artifact(artifact_dir):
+    from xgboost import Booster
+
+    with open(os.path.join(artifact_dir, MANIFEST_FILE), "r") as f:
+        manifest = json.load(f)
+
+    if manifest["version"] != ARTIFACT_VERSION:
+        raise ValueError(
+            f"Unsupported artifact version {manifest['version']}, "
+            f"expected {ARTIFACT_VERSION}."
+        )
+
+    booster = Booster(
+        model_file=os.path.join(artifact_dir, manifest["booster"])
+    )
+    history = None
+    if "history" in manifest:
+        from sighting_index import SightingCube
+
+        history = SightingCube.load(
+            os.path.join(artifact_dir, manifest["history"]["file"])
+        )
+    return PortableModel(manifest, booster, history)
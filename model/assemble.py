@@ -1,5 +1,6 @@
 import click
-import pandas as pd
+
+from interchange import apply_schema, read_frame, schema, write_frame
 
 
 RAW_FEATURES = [
@@ -29,30 +30,44 @@ TARGET = "sighting"
 ALL_COLUMNS = RAW_FEATURES + [TARGET]
 
 
+def assemble(sightings, not_sightings):
+    import pandas as pd
+
+    # The sightings CSV is the raw edge of the pipeline, so cast both sides
+    # to the training schema before concatenating.
+    training_schema = schema(ALL_COLUMNS)
+    return pd.concat(
+        [
+            apply_schema(
+                sightings.query("~latitude.isnull()").assign(sighting=True),
+                training_schema,
+            ),
+            apply_schema(
+                not_sightings.query("~latitude.isnull()").assign(
+                    sighting=False
+                ),
+                training_schema,
+            ),
+        ]
+    )
+
+
 @click.command()
 @click.argument("sightings", type=click.File("r"))
-@click.argument("not_sightings", type=click.File("r"))
+@click.argument("not_sightings", type=click.Path(exists=True))
 @click.option(
     "--output-file",
     "-o",
-    type=click.File("w"),
-    default="data/processed/raw_training_data.csv",
+    type=click.Path(),
+    default="data/processed/raw_training_data.parquet",
 )
 def main(sightings, not_sightings, output_file):
-    sightings_df = (
-        pd.read_csv(sightings)
-        .query("~latitude.isnull()")
-        .assign(sighting=True)
-    )
-    not_sightings_df = (
-        pd.read_csv(not_sightings)
-        .query("~latitude.isnull()")
-        .assign(sighting=False)
-    )
+    import pandas as pd
 
-    pd.concat(
-        [sightings_df[ALL_COLUMNS], not_sightings_df[ALL_COLUMNS]]
-    ).to_csv(output_file, index=False)
+    write_frame(
+        assemble(pd.read_csv(sightings), read_frame(not_sightings)),
+        output_file,
+    )
 
 
 if __name__ == "__main__":
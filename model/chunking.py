@@ -0,0 +1,6 @@
+def chunk_sizes(num_items, chunk_size):
+    """ Sizes of the chunks that split num_items into pieces of chunk_size,
+        with any remainder last.
+    """
+    full_chunks, remainder = divmod(num_items, chunk_size)
+    return [chunk_size] * full_chunks + ([remainder] if remainder else [])
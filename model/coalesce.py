@@ -0,0 +1,46 @@
+from interchange import SAMPLE_COLUMNS
+
+
+def snap_to_cells(latitudes, longitudes, resolution):
+    """ Moves each point to the center of its H3 cell at resolution. """
+    import numpy as np
+
+    from h3 import h3
+
+    centers = {}
+    snapped = []
+    for latitude, longitude in zip(latitudes, longitudes):
+        cell = h3.geo_to_h3(latitude, longitude, resolution)
+        if cell not in centers:
+            centers[cell] = h3.h3_to_geo(cell)
+        snapped.append(centers[cell])
+    snapped = np.array(snapped, dtype=float).reshape(-1, 2)
+    return snapped[:, 0], snapped[:, 1]
+
+
+def coalesce(samples, resolution):
+    """ Request coordinates for each sample: the sample's own location, or
+        with a resolution, the center of its cell at that resolution so
+        nearby samples on the same date share one request. Rows line up
+        with samples; the results fan back out by position.
+    """
+    if resolution is None:
+        return samples[SAMPLE_COLUMNS].copy()
+
+    latitudes, longitudes = snap_to_cells(
+        samples.latitude, samples.longitude, resolution
+    )
+    return samples[SAMPLE_COLUMNS].assign(
+        latitude=latitudes, longitude=longitudes
+    )
+
+
+def coalesce_stats(requests):
+    rows = requests.shape[0]
+    distinct = requests.drop_duplicates(subset=SAMPLE_COLUMNS).shape[0]
+    return {
+        "rows": rows,
+        "requests": distinct,
+        "saved": rows - distinct,
+        "saved_fraction": (rows - distinct) / rows if rows else 0.0,
+    }
@@ -0,0 +1,60 @@
+import json
+
+from interchange import read_frame
+
+
+def is_compact(coverage):
+    return "coverage_resolution" in coverage.columns
+
+
+def coverage_resolution(coverage):
+    if is_compact(coverage):
+        return int(coverage.coverage_resolution.iloc[0])
+    from h3 import h3
+
+    return h3.h3_get_resolution(coverage.hex_address.iloc[0])
+
+
+def expand(coverage, resolution=None):
+    """ Uncompacts a coverage table to single resolution cells, by default
+        at the resolution it was built at.
+    """
+    import pandas as pd
+
+    from h3 import h3
+
+    resolution = (
+        coverage_resolution(coverage) if resolution is None else resolution
+    )
+    if not is_compact(coverage) and resolution == coverage_resolution(
+        coverage
+    ):
+        return coverage
+    return pd.DataFrame(
+        {
+            "hex_address": sorted(
+                h3.uncompact(set(coverage.hex_address), resolution)
+            )
+        }
+    )
+
+
+def with_boundaries(coverage):
+    from h3 import h3
+
+    if "hex_geojson" in coverage.columns:
+        return coverage
+    return coverage.assign(
+        hex_geojson=[
+            json.dumps(h3.h3_to_geo_boundary(hex_address, geo_json=True))
+            for hex_address in coverage.hex_address
+        ]
+    )
+
+
+def load_coverage(path, resolution=None, boundaries=False):
+    """ Reads a hexagon table written by us_hexagons.py, compacted or not,
+        as single resolution cells. Boundaries are only built on request.
+    """
+    coverage = expand(read_frame(path), resolution)
+    return with_boundaries(coverage) if boundaries else coverage
@@ -0,0 +1,217 @@
+import numpy as np
+
+from multiprocessing import Pool
+from chunking import chunk_sizes
+
+
+METRICS = ["accuracy", "f1", "precision", "recall", "auc", "brier", "ece"]
+# Resamples scored together, bounding memory at this many rows of weights.
+BATCH_SIZE = 64
+
+
+# Per-process state for the worker pool, set once by the initializer so the
+# test set isn't pickled with every chunk.
+_worker_args = None
+
+
+def _init_worker(*args):
+    global _worker_args
+    _worker_args = args
+
+
+def _safe_divide(numerator, denominator):
+    # Zero where undefined, as sklearn reports by default.
+    return np.divide(
+        numerator,
+        denominator,
+        out=np.zeros_like(numerator, dtype=float),
+        where=denominator > 0,
+    )
+
+
+def calibration_bins(probabilities, num_bins):
+    """ The uniform [0, 1] bin of each probability, 1.0 in the last bin. """
+    return np.minimum((probabilities * num_bins).astype(int), num_bins - 1)
+
+
+class TestSet:
+    """ Everything about the test predictions that doesn't change between
+        resamples, precomputed once so each resample is a weighted sum.
+    """
+
+    def __init__(self, y, prediction, probability, num_bins=10):
+        self.y = np.asarray(y, dtype=bool)
+        self.prediction = np.asarray(prediction, dtype=bool)
+        self.probability = np.asarray(probability, dtype=float)
+        self.num_bins = num_bins
+        # Rows sorted by score and split into runs of equal scores, so AUC
+        # handles ties the way roc_auc_score does.
+        self.order = np.argsort(self.probability, kind="stable")
+        sorted_probability = self.probability[self.order]
+        self.tie_starts = np.flatnonzero(
+            np.r_[True, sorted_probability[1:] != sorted_probability[:-1]]
+        )
+        self.bins = calibration_bins(self.probability, num_bins)
+        self.bin_indicator = (
+            self.bins[:, None] == np.arange(num_bins)[None, :]
+        ).astype(float)
+
+    @property
+    def size(self):
+        return self.y.size
+
+    def metrics(self, weights):
+        """ Metrics for each row of weights, the number of times each test
+            row was drawn. A row of ones is the test set itself.
+        """
+        y, prediction = self.y, self.prediction
+        total = weights.sum(axis=1)
+        positives = weights @ y
+        true_positives = weights @ (y & prediction)
+        predicted_positives = weights @ prediction
+        precision = _safe_divide(true_positives, predicted_positives)
+        recall = _safe_divide(true_positives, positives)
+
+        # AUC is the chance a positive outscores a negative, ties count half.
+        ordered = weights[:, self.order]
+        positive_runs = np.add.reduceat(
+            ordered * y[self.order], self.tie_starts, axis=1
+        )
+        negative_runs = np.add.reduceat(
+            ordered * ~y[self.order], self.tie_starts, axis=1
+        )
+        negatives_below = np.cumsum(negative_runs, axis=1) - negative_runs
+        auc = _safe_divide(
+            (positive_runs * (negatives_below + 0.5 * negative_runs)).sum(
+                axis=1
+            ),
+            positives * (total - positives),
+        )
+
+        bin_counts = weights @ self.bin_indicator
+        bin_probability = (weights * self.probability) @ self.bin_indicator
+        bin_positives = (weights * y) @ self.bin_indicator
+        return {
+            "accuracy": (weights @ (y == prediction)) / total,
+            "f1": _safe_divide(2 * precision * recall, precision + recall),
+            "precision": precision,
+            "recall": recall,
+            "auc": auc,
+            "brier": (weights @ (self.probability - y) ** 2) / total,
+            # Expected calibration error, the count weighted gap per bin.
+            "ece": np.abs(bin_probability - bin_positives).sum(axis=1)
+            / total,
+            # Empty bins have no observed rate.
+            "observed_rate": np.where(
+                bin_counts > 0,
+                bin_positives / np.maximum(bin_counts, 1),
+                np.nan,
+            ),
+        }
+
+    def resample_weights(self, num_resamples, rng):
+        """ Draw counts for num_resamples bootstrap resamples at once. """
+        draws = rng.integers(0, self.size, size=(num_resamples, self.size))
+        offsets = np.arange(num_resamples)[:, None] * self.size
+        return np.bincount(
+            (draws + offsets).ravel(), minlength=num_resamples * self.size
+        ).reshape(num_resamples, self.size)
+
+
+def _bootstrap_chunk(num_resamples, seed_sequence):
+    test_set = _worker_args[0]
+    rng = np.random.default_rng(seed_sequence)
+    results = []
+    for start in range(0, num_resamples, BATCH_SIZE):
+        weights = test_set.resample_weights(
+            min(BATCH_SIZE, num_resamples - start), rng
+        ).astype(float)
+        results.append(test_set.metrics(weights))
+    return {
+        name: np.concatenate([result[name] for result in results])
+        for name in results[0]
+    }
+
+
+def bootstrap(test_set, num_resamples, seed=None, workers=1, chunk_size=250):
+    """ Metrics for num_resamples bootstrap resamples of the test set. Each
+        chunk has its own seed stream spawned from seed, so the resamples
+        only depend on seed and chunk_size, never on the number of workers.
+    """
+    sizes = chunk_sizes(num_resamples, chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    if workers == 1:
+        _init_worker(test_set)
+        chunks = [_bootstrap_chunk(*chunk) for chunk in zip(sizes, seeds)]
+    else:
+        with Pool(
+            min(workers, len(sizes)), _init_worker, (test_set,)
+        ) as pool:
+            chunks = pool.starmap(_bootstrap_chunk, zip(sizes, seeds))
+    return {
+        name: np.concatenate([chunk[name] for chunk in chunks])
+        for name in chunks[0]
+    }
+
+
+def confidence_intervals(resampled, confidence=0.95):
+    """ Percentile intervals per metric, and per bin for the observed rate.
+    """
+    tail = 100 * (1 - confidence) / 2
+    return {
+        name: np.nanpercentile(values, [tail, 100 - tail], axis=0)
+        for name, values in resampled.items()
+    }
+
+
+def calibration_curve(test_set, point, intervals):
+    """ One row per non-empty bin: mean predicted probability, observed
+        positive rate and its interval, and the number of test rows.
+    """
+    import pandas as pd
+
+    counts = np.bincount(test_set.bins, minlength=test_set.num_bins)
+    predicted = _safe_divide(
+        np.bincount(
+            test_set.bins,
+            weights=test_set.probability,
+            minlength=test_set.num_bins,
+        ),
+        counts,
+    )
+    lower, upper = intervals["observed_rate"]
+    edges = np.linspace(0, 1, test_set.num_bins + 1)
+    return pd.DataFrame(
+        {
+            "bin_lower": edges[:-1],
+            "bin_upper": edges[1:],
+            "count": counts,
+            "mean_predicted": predicted,
+            "observed_rate": point["observed_rate"][0],
+            "observed_rate_lower": lower,
+            "observed_rate_upper": upper,
+        }
+    ).query("count > 0")
+
+
+def plot_calibration(curve, plot_file):
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(6, 6))
+    ax.plot([0, 1], [0, 1], linestyle="--", color="grey")
+    ax.errorbar(
+        curve.mean_predicted,
+        curve.observed_rate,
+        yerr=[
+            curve.observed_rate - curve.observed_rate_lower,
+            curve.observed_rate_upper - curve.observed_rate,
+        ],
+        marker="o",
+        capsize=3,
+    )
+    ax.set_xlabel("Mean predicted probability")
+    ax.set_ylabel("Observed sighting rate")
+    ax.set_xlim(0, 1)
+    ax.set_ylim(0, 1)
+    fig.savefig(plot_file)
+    plt.close(fig)
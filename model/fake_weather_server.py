@@ -0,0 +1,169 @@
+import click
+import hashlib
+import random
+
+from time import monotonic
+from datetime import datetime, timedelta, timezone
+from loguru import logger
+
+
+PRECIP_TYPES = ["rain", "snow", "sleet"]
+# Dark Sky forecasts cover today plus the next week.
+FORECAST_DAYS = 8
+
+
+def daily_conditions(latitude, longitude, day, rng):
+    """ One plausible Dark Sky daily data point. Temperatures follow
+        latitude and season, the rest is noise in realistic ranges.
+    """
+    season = -abs(day.month - 7) / 6.0
+    temperature_high = (
+        95 - 0.9 * abs(latitude) + 25 * season + rng.gauss(0, 8)
+    )
+    temperature_low = temperature_high - rng.uniform(8, 25)
+    precip_probability = round(rng.betavariate(0.6, 1.8), 2)
+    conditions = {
+        "time": int(day.replace(tzinfo=timezone.utc).timestamp()),
+        "temperatureHigh": round(temperature_high, 2),
+        "temperatureLow": round(temperature_low, 2),
+        "dewPoint": round(temperature_low - rng.uniform(0, 10), 2),
+        "humidity": round(rng.uniform(0.2, 1.0), 2),
+        "cloudCover": round(rng.uniform(0, 1), 2),
+        "moonPhase": round((day.toordinal() % 29.53) / 29.53, 2),
+        "precipIntensity": round(precip_probability * rng.uniform(0, 0.1), 4),
+        "precipProbability": precip_probability,
+        "pressure": round(rng.gauss(1015, 8), 1),
+        "uvIndex": rng.randint(0, 10),
+        "visibility": round(rng.uniform(2, 10), 2),
+        "windBearing": rng.randint(0, 359),
+        "windSpeed": round(rng.expovariate(1 / 6), 2),
+    }
+    if precip_probability > 0.2:
+        if temperature_high < 32:
+            conditions["precipType"] = "snow"
+        elif temperature_low < 32:
+            conditions["precipType"] = rng.choice(PRECIP_TYPES)
+        else:
+            conditions["precipType"] = "rain"
+    return conditions
+
+
+def weather_payload(latitude, longitude, time=None):
+    """ A deterministic payload for a location and optional ISO time, one day
+        for time machine requests and a week for forecasts.
+    """
+    rng = random.Random(
+        hashlib.sha256(f"{latitude},{longitude},{time}".encode()).hexdigest()
+    )
+    if time is None:
+        start = datetime.utcnow().replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        num_days = FORECAST_DAYS
+    else:
+        start = datetime.strptime(time[:10], "%Y-%m-%d")
+        num_days = 1
+    return {
+        "latitude": latitude,
+        "longitude": longitude,
+        "timezone": "America/Chicago",
+        "daily": {
+            "data": [
+                daily_conditions(
+                    latitude, longitude, start + timedelta(days=day), rng
+                )
+                for day in range(num_days)
+            ]
+        },
+    }
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = monotonic()
+
+    def take(self):
+        now = monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+def make_app(latency_ms=50, jitter_ms=25, error_rate=0.0, rate_limit=None):
+    """ An aiohttp app that answers /forecast/{key}/{lat},{lon}[,{time}]
+        like Dark Sky. rate_limit is requests per second, answered with 429
+        beyond that.
+    """
+    import asyncio
+
+    from aiohttp import web
+
+    bucket = (
+        TokenBucket(rate_limit, max(1, rate_limit)) if rate_limit else None
+    )
+    counters = {"requests": 0, "errors": 0, "throttled": 0}
+
+    async def forecast(request):
+        counters["requests"] += 1
+        latency = max(0.0, random.gauss(latency_ms, jitter_ms)) / 1000
+        await asyncio.sleep(latency)
+
+        if bucket is not None and not bucket.take():
+            counters["throttled"] += 1
+            return web.json_response({"error": "rate limited"}, status=429)
+        if random.random() < error_rate:
+            counters["errors"] += 1
+            return web.json_response({"error": "server error"}, status=503)
+
+        parts = request.match_info["location"].split(",")
+        try:
+            latitude, longitude = float(parts[0]), float(parts[1])
+        except (IndexError, ValueError):
+            return web.json_response(
+                {"error": "poorly formatted request"}, status=400
+            )
+        time = parts[2] if len(parts) > 2 else None
+        return web.json_response(weather_payload(latitude, longitude, time))
+
+    async def stats(request):
+        return web.json_response(counters)
+
+    app = web.Application()
+    app.router.add_get("/forecast/{key}/{location}", forecast)
+    app.router.add_get("/stats", stats)
+    return app
+
+
+@click.command()
+@click.option("--host", type=str, default="127.0.0.1")
+@click.option("--port", type=int, default=8765)
+@click.option("--latency-ms", type=float, default=50.0)
+@click.option("--jitter-ms", type=float, default=25.0)
+@click.option("--error-rate", type=float, default=0.0)
+@click.option(
+    "--rate-limit", type=float, default=None, help="Requests per second."
+)
+def main(host, port, latency_ms, jitter_ms, error_rate, rate_limit):
+    """ Local stand-in for the Dark Sky API. Point the fetchers at it with
+        DARK_SKY_URL=http://HOST:PORT.
+    """
+    from aiohttp import web
+
+    logger.info(f"Serving fake Dark Sky at http://{host}:{port}.")
+    web.run_app(
+        make_app(latency_ms, jitter_ms, error_rate, rate_limit),
+        host=host,
+        port=port,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,8 @@ from sklearn.base import BaseEstimator, TransformerMixin
 from h3 import h3
 
 from assemble import RAW_FEATURES, TARGET
+from interchange import read_frame, write_frame
+from sighting_index import SightingCube, SightingIndex
 
 
 def featurize_time(frame, date_col="date"):
@@ -29,23 +31,28 @@ class GeospatialDiscretizer(BaseEstimator, TransformerMixin):
     def fit(self, X, y):
         # X is a Nx2 lat/lon data frame.
         # y is boolean numpy array.
-        self.hex_frame = (
-            pd.DataFrame(
-                {
-                    "latitude": X[y]["latitude"],
-                    "longitude": X[y]["longitude"],
-                    "h3": np.apply_along_axis(
-                        lambda x: h3.geo_to_h3(x[0], x[1], self.resolution),
-                        axis=1,
-                        arr=X[y],
-                    ),
-                }
-            )
-            .groupby("h3")
-            .agg({"h3": "count"})
+        sightings = X[y]
+        index = SightingIndex.from_points(
+            sightings["latitude"].values,
+            sightings["longitude"].values,
+            [self.resolution],
+        )
+        self.hex_frame = pd.DataFrame(
+            {"h3": index.counts[self.resolution]},
+            index=pd.Index(index.hex_addresses(self.resolution), name="h3"),
         )
         return self
 
+    def partial_fit(self, X, y):
+        # Adds the counts for new sightings to the ones already fit.
+        if not np.asarray(y).any():
+            return self
+        new_hex_frame = GeospatialDiscretizer(self.resolution).fit(X, y)
+        self.hex_frame = self.hex_frame.add(
+            new_hex_frame.hex_frame, fill_value=0
+        ).astype(int)
+        return self
+
     def transform(self, X):
         h3_X = np.apply_along_axis(
             lambda x: h3.geo_to_h3(x[0], x[1], self.resolution), axis=1, arr=X
@@ -54,7 +61,56 @@ class GeospatialDiscretizer(BaseEstimator, TransformerMixin):
         return self.hex_frame.reindex(h3_X, fill_value=0)
 
 
-def feature_pipeline(resolution):
+class SightingHistory(BaseEstimator, TransformerMixin):
+    """ Sightings in each row's hexagon during the window_months before the
+        row's month, from a cell x month SightingCube. The row's own month
+        is left out so a sighting never counts itself.
+    """
+
+    def __init__(self, resolution, window_months=12):
+        self.resolution = resolution
+        self.window_months = window_months
+        self.cube = None
+
+    def _cube(self, X, y):
+        sightings = X[np.asarray(y, dtype=bool)]
+        return SightingCube.from_points(
+            sightings["date"].values,
+            sightings["latitude"].values,
+            sightings["longitude"].values,
+            self.resolution,
+        )
+
+    def fit(self, X, y):
+        # X is a date/lat/lon data frame.
+        self.cube = self._cube(X, y)
+        return self
+
+    def partial_fit(self, X, y):
+        self.cube = self.cube.add(self._cube(X, y))
+        return self
+
+    def transform(self, X):
+        return self.cube.trailing_counts(
+            X["date"].values,
+            X["latitude"].values,
+            X["longitude"].values,
+            self.window_months,
+        ).reshape(-1, 1)
+
+
+def feature_pipeline(resolution, history_months=None):
+    history = (
+        # Recent sightings nearby, when asked for.
+        [
+            (
+                SightingHistory(resolution, history_months),
+                ["date", "latitude", "longitude"],
+            )
+        ]
+        if history_months
+        else []
+    )
     column_transformer = make_column_transformer(
         # Featurize the dates and drop the date column.
         (FunctionTransformer(featurize_time, validate=False), ["date"]),
@@ -63,6 +119,7 @@ def feature_pipeline(resolution):
             GeospatialDiscretizer(resolution=resolution),
             ["latitude", "longitude"],
         ),
+        *history,
         # One-hot the precip_type.
         (
             make_pipeline(
@@ -93,40 +150,68 @@ def get_one_hot_precip(pipeline):
     )
 
 
+def get_geospatial_discretizer(pipeline):
+    # The column transformer holds the fitted discretizer second.
+    return pipeline.steps[0][1].transformers_[1][1]
+
+
+def get_sighting_history(pipeline):
+    # Only there when the pipeline was built with history_months.
+    return next(
+        (
+            transformer
+            for _, transformer, _ in pipeline.steps[0][1].transformers_
+            if isinstance(transformer, SightingHistory)
+        ),
+        None,
+    )
+
+
 def get_features(pipeline):
+    history = (
+        ["recent_sightings"]
+        if get_sighting_history(pipeline) is not None
+        else []
+    )
     return (
         ["month", "nearby_sightings"]
+        + history
         + list(get_one_hot_precip(pipeline))
         + RAW_FEATURES[4:]
     )
 
 
 @click.command()
-@click.argument("raw_features_file", type=click.File("r"))
+@click.argument("raw_features_file", type=click.Path(exists=True))
 @click.option(
     "--output-file",
-    type=click.File("w"),
+    type=click.Path(),
     default="data/processed/training_data.csv",
 )
 @click.option("--resolution", "-r", type=int, default=3)
-def main(raw_features_file, output_file, resolution):
-    raw_features = pd.read_csv(raw_features_file).assign(
-        date=lambda x: pd.to_datetime(x.date)
-    )
+@click.option(
+    "--history-months",
+    type=int,
+    default=None,
+    help="Add sightings in the same hexagon over this many prior months.",
+)
+def main(raw_features_file, output_file, resolution, history_months):
+    # Dates come in already typed from the interchange file.
+    raw_features = read_frame(raw_features_file)
 
-    pipeline = feature_pipeline(resolution)
+    pipeline = feature_pipeline(resolution, history_months)
 
     features = pipeline.fit_transform(
         raw_features[RAW_FEATURES], raw_features[TARGET].values
     )
 
-    # Save features to a CSV.
+    # Save features, usually as a CSV for svl.
     feature_frame = pd.DataFrame(
         np.concatenate([features, raw_features[[TARGET]].values], axis=1),
         columns=get_features(pipeline),
     )
 
-    feature_frame.to_csv(output_file, index=False)
+    write_frame(feature_frame, output_file)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,336 @@
+import click
+import json
+import os
+import sys
+
+from time import perf_counter
+from loguru import logger
+from weather import DARK_SKY_KEY, DARK_SKY_URL, create_weather_request
+
+
+# Statuses worth retrying; everything else is a permanent failure.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def request_key(date, latitude, longitude):
+    # repr round-trips floats exactly, so keys match across runs.
+    return f"{date}|{latitude!r}|{longitude!r}"
+
+
+def read_journal(journal_file):
+    """ Reads completed requests keyed by request_key. A crash can leave a
+        partial last line, which is skipped and fetched again.
+    """
+    completed = {}
+    if not os.path.exists(journal_file):
+        return completed
+    with open(journal_file, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning("Skipping a truncated journal line.")
+                continue
+            completed[record["key"]] = record
+    return completed
+
+
+class Journal:
+    """ Append-only JSON lines file of successful responses. Each record is
+        flushed and synced before the request counts as done.
+    """
+
+    def __init__(self, journal_file):
+        self.file = open(journal_file, "a")
+
+    def write(self, record):
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+class FetchStats:
+    def __init__(self):
+        self.latencies = []
+        self.succeeded = 0
+        self.failed = 0
+        self.retries = 0
+        self.statuses = {}
+
+    def record_status(self, status):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def summary(self, elapsed):
+        """ Throughput and latency percentiles over elapsed seconds. """
+        import numpy as np
+
+        latencies = np.array(self.latencies) * 1000
+        p50, p95, p99 = (
+            np.percentile(latencies, [50, 95, 99])
+            if latencies.size
+            else (np.nan,) * 3
+        )
+        return {
+            "attempts": int(latencies.size),
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retries": self.retries,
+            "elapsed_s": elapsed,
+            "throughput_rps": self.succeeded / elapsed if elapsed else 0.0,
+            "p50_ms": float(p50),
+            "p95_ms": float(p95),
+            "p99_ms": float(p99),
+            "statuses": {str(k): v for k, v in self.statuses.items()},
+        }
+
+
+async def fetch_one(
+    session, semaphore, request, journal, stats, retries, backoff
+):
+    import asyncio
+    import aiohttp
+
+    key, date, latitude, longitude, url = request
+    for attempt in range(retries + 1):
+        if attempt > 0:
+            stats.retries += 1
+            await asyncio.sleep(backoff * 2 ** (attempt - 1))
+        async with semaphore:
+            start = perf_counter()
+            try:
+                async with session.get(url) as response:
+                    payload = await response.text()
+                    status = response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                stats.record_status("error")
+                continue
+            finally:
+                stats.latencies.append(perf_counter() - start)
+
+        stats.record_status(status)
+        if status == 200:
+            journal.write(
+                {
+                    "key": key,
+                    "date": date,
+                    "latitude": latitude,
+                    "longitude": longitude,
+                    "payload": payload,
+                }
+            )
+            stats.succeeded += 1
+            return
+        if status not in RETRY_STATUSES:
+            break
+
+    stats.failed += 1
+
+
+async def fetch_all(
+    requests, journal, concurrency, retries, backoff, timeout, progress=None
+):
+    """ Fetches every (key, date, lat, lon, url) request with at most
+        concurrency requests in flight, journaling each success.
+    """
+    import asyncio
+    import aiohttp
+
+    stats = FetchStats()
+    semaphore = asyncio.Semaphore(concurrency)
+    async with aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=timeout)
+    ) as session:
+        tasks = [
+            fetch_one(
+                session, semaphore, request, journal, stats, retries, backoff
+            )
+            for request in requests
+        ]
+        for task in asyncio.as_completed(tasks):
+            await task
+            if progress is not None:
+                progress.update(1)
+    return stats
+
+
+def run_fetch(requests, journal_file, concurrency, retries, backoff, timeout):
+    import asyncio
+
+    from tqdm import tqdm
+
+    journal = Journal(journal_file)
+    try:
+        with tqdm(total=len(requests)) as progress:
+            # Python 3.6 doesn't have asyncio.run.
+            return asyncio.get_event_loop().run_until_complete(
+                fetch_all(
+                    requests,
+                    journal,
+                    concurrency,
+                    retries,
+                    backoff,
+                    timeout,
+                    progress,
+                )
+            )
+    finally:
+        journal.close()
+
+
+@click.command()
+@click.argument("data_file", type=click.Path(exists=True))
+@click.option(
+    "--journal-file",
+    type=click.Path(),
+    default="data/interim/weather_journal.jsonl",
+)
+@click.option(
+    "--store-dir",
+    type=click.Path(),
+    default="data/interim/weather_store",
+)
+@click.option(
+    "--output-file",
+    type=click.Path(),
+    default="data/interim/synthesized_not_sightings.parquet",
+)
+@click.option("--concurrency", type=int, default=10)
+@click.option("--retries", type=int, default=3)
+@click.option("--backoff", type=float, default=1.0, help="Seconds.")
+@click.option("--timeout", type=float, default=30.0, help="Seconds.")
+@click.option("--base-url", type=str, default=DARK_SKY_URL)
+@click.option(
+    "--coalesce-resolution",
+    type=int,
+    default=None,
+    help="Share one request per H3 cell at this resolution and date.",
+)
+def main(
+    data_file,
+    journal_file,
+    store_dir,
+    output_file,
+    concurrency,
+    retries,
+    backoff,
+    timeout,
+    base_url,
+    coalesce_resolution,
+):
+    """ Fetches historical weather for every sample in DATA_FILE. Completed
+        requests are journaled, so a rerun only fetches what's missing.
+    """
+    import pandas as pd
+
+    from coalesce import coalesce, coalesce_stats
+    from interchange import SAMPLE_COLUMNS, read_frame, schema, write_frame
+    from weather_store import WEATHER_COLUMNS, WeatherColumns, WeatherStore
+
+    samples = read_frame(data_file, schema(SAMPLE_COLUMNS)).query(
+        "~latitude.isnull()"
+    )
+    # One row per sample with the location the weather is requested for.
+    locations = coalesce(samples, coalesce_resolution)
+    saved = coalesce_stats(locations)
+    logger.info(
+        f"{saved['rows']} samples need {saved['requests']} distinct "
+        f"requests, saving {saved['saved']} calls "
+        f"({saved['saved_fraction']:.1%})."
+    )
+
+    dates = locations.date.dt.strftime("%Y-%m-%d").tolist()
+    keys = [
+        request_key(date, latitude, longitude)
+        for date, latitude, longitude in zip(
+            dates, locations.latitude, locations.longitude
+        )
+    ]
+
+    completed = read_journal(journal_file)
+    requests = {}
+    for key, date, latitude, longitude in zip(
+        keys, dates, locations.latitude, locations.longitude
+    ):
+        if key in completed or key in requests:
+            continue
+        requests[key] = (
+            key,
+            date,
+            latitude,
+            longitude,
+            create_weather_request(
+                latitude,
+                longitude,
+                date + "T00:00:00",
+                key=DARK_SKY_KEY,
+                base_url=base_url,
+            ),
+        )
+    logger.info(
+        f"{len(keys)} samples, {len(completed)} already journaled, "
+        f"{len(requests)} to fetch."
+    )
+
+    if requests:
+        stats = run_fetch(
+            list(requests.values()),
+            journal_file,
+            concurrency,
+            retries,
+            backoff,
+            timeout,
+        )
+        logger.info(
+            f"Fetched {stats.succeeded}, failed {stats.failed}, "
+            f"retried {stats.retries} times."
+        )
+        completed = read_journal(journal_file)
+
+    # Move journaled payloads the store hasn't seen into typed columns.
+    store = WeatherStore(store_dir)
+    stored_keys = store.keys()
+    columns = WeatherColumns()
+    for record in completed.values():
+        date = pd.Timestamp(record["date"])
+        if (date, record["latitude"], record["longitude"]) in stored_keys:
+            continue
+        columns.append_payload(
+            record["date"],
+            record["latitude"],
+            record["longitude"],
+            record["payload"],
+        )
+    logger.info(f"Appending {len(columns)} rows to {store_dir}.")
+    store.append(columns)
+
+    # A sample is missing when its request has no stored response at all.
+    # Fields such as temperatureHigh can be absent from valid responses, so
+    # the weather values themselves don't say what's missing.
+    stored_keys = store.keys()
+    missing = sum(
+        (pd.Timestamp(date), latitude, longitude) not in stored_keys
+        for date, latitude, longitude in zip(
+            dates, locations.latitude, locations.longitude
+        )
+    )
+    if missing:
+        logger.error(
+            f"{missing} samples have no weather yet, not writing "
+            f"{output_file}. Rerun to retry them."
+        )
+        sys.exit(1)
+
+    # Fan each request's weather back out to the samples that share it.
+    weather = store.lookup(locations).assign(
+        latitude=samples.latitude.values, longitude=samples.longitude.values
+    )
+
+    logger.info(f"Writing weather to {output_file}.")
+    write_frame(weather, output_file, schema(WEATHER_COLUMNS))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import numpy as np
+
+# Vectorized helpers for H3 indexes held as uint64 numpy arrays. The layout
+# is documented at https://h3geo.org/docs/core-library/h3Indexing: the
+# resolution lives in bits 52-55 and each resolution 1-15 has a 3 bit digit,
+# with the resolution 1 digit highest. Unused digits are set to 7.
+
+MAX_RESOLUTION = 15
+RESOLUTION_OFFSET = np.uint64(52)
+RESOLUTION_MASK = np.uint64(0xF) << RESOLUTION_OFFSET
+DIGIT_MASK = np.uint64(7)
+# Pentagons have no children in the deleted K direction (digit 1).
+PENTAGON_DIGITS = np.array([0, 2, 3, 4, 5, 6], dtype=np.uint64)
+
+
+def to_int(hex_addresses):
+    return np.array([int(h, 16) for h in hex_addresses], dtype=np.uint64)
+
+
+def to_str(cells):
+    return [format(cell, "x") for cell in cells.tolist()]
+
+
+def digit_offset(resolution):
+    return np.uint64((MAX_RESOLUTION - resolution) * 3)
+
+
+def get_resolution(cells):
+    return ((cells & RESOLUTION_MASK) >> RESOLUTION_OFFSET).astype(int)
+
+
+def set_resolution(cells, resolution):
+    return (cells & ~RESOLUTION_MASK) | (
+        np.uint64(resolution) << RESOLUTION_OFFSET
+    )
+
+
+def random_children(cells, is_pentagon, resolution, rng):
+    """ Draws one uniformly random descendant at resolution for every cell,
+        equivalent to repeatedly picking a random child one level at a time.
+    """
+    cell_resolutions = get_resolution(cells)
+    if (cell_resolutions > resolution).any():
+        raise ValueError(f"Cells are finer than resolution {resolution}.")
+
+    children = cells.copy()
+    on_pentagon = np.asarray(is_pentagon, dtype=bool).copy()
+    for level in range(1, resolution + 1):
+        # Draw for every row so the stream doesn't depend on the mix of
+        # root resolutions.
+        digits = rng.integers(0, 7, size=cells.shape[0]).astype(np.uint64)
+        pentagon_digits = PENTAGON_DIGITS[
+            rng.integers(0, 6, size=cells.shape[0])
+        ]
+        digits = np.where(on_pentagon, pentagon_digits, digits)
+
+        descend = cell_resolutions < level
+        offset = digit_offset(level)
+        children = np.where(
+            descend,
+            (children & ~(DIGIT_MASK << offset)) | (digits << offset),
+            children,
+        )
+        # Only the center child of a pentagon is a pentagon.
+        on_pentagon &= ~descend | (digits == 0)
+
+    return set_resolution(children, resolution)
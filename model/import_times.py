@@ -0,0 +1,153 @@
+import click
+import json
+import os
+import subprocess
+import sys
+
+from time import time
+from loguru import logger
+
+
+ENTRY_POINTS = [
+    "model/us_shp_to_geojson.py",
+    "model/us_hexagons.py",
+    "model/synthesize.py",
+    "model/weather.py",
+    "model/unpack_weather_results.py",
+    "model/assemble.py",
+    "model/features.py",
+    "model/train_model.py",
+    "model/fetch_weather.py",
+    "model/update_model.py",
+    "model/pipeline.py",
+    "model/score_server.py",
+    "squatchcast/squatchcast.py",
+]
+# Import times depend on the machine, so the baseline is recorded locally
+# (make import_times_baseline) and only rewritten with --update-baseline.
+BASELINE_FILE = "data/import_times_baseline.json"
+
+
+def parse_import_times(stderr):
+    """ Parses the output of python -X importtime into a dict of
+        module -> (self us, cumulative us).
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        # The header row has no numbers in it.
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        self_us, cumulative_us, module = fields
+        modules[module.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def time_entry_point(entry_point, top):
+    start = time()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", entry_point, "--help"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    wall_s = time() - start
+    if result.returncode != 0:
+        logger.warning(f"{entry_point} --help exited {result.returncode}.")
+
+    modules = parse_import_times(result.stderr)
+    slowest = sorted(
+        modules.items(), key=lambda item: item[1][1], reverse=True
+    )[:top]
+    return {
+        "wall_s": wall_s,
+        "import_s": sum(s for s, _ in modules.values()) / 1e6,
+        "num_modules": len(modules),
+        "slowest": [
+            {"module": module, "cumulative_s": cumulative / 1e6}
+            for module, (_, cumulative) in slowest
+        ],
+    }
+
+
+@click.command()
+@click.argument("entry_points", nargs=-1, type=str)
+@click.option("--output-file", type=str, default="data/import_times.json")
+@click.option(
+    "--baseline-file",
+    type=click.Path(),
+    default=BASELINE_FILE,
+    help="Report from this machine to compare against.",
+)
+@click.option(
+    "--update-baseline",
+    is_flag=True,
+    default=False,
+    help="Replace the baseline with this run instead of comparing.",
+)
+@click.option(
+    "--tolerance",
+    type=float,
+    default=1.5,
+    help="Fail when import time exceeds baseline by this factor.",
+)
+@click.option("--top", type=int, default=5)
+def main(
+    entry_points, output_file, baseline_file, update_baseline, tolerance, top
+):
+    """ Records the startup import time of each entry point's --help. """
+    if os.path.abspath(output_file) == os.path.abspath(baseline_file):
+        raise click.UsageError(
+            "The output file can't be the baseline, use --update-baseline."
+        )
+    entry_points = entry_points or ENTRY_POINTS
+    baseline = {}
+    if not update_baseline:
+        if os.path.exists(baseline_file):
+            with open(baseline_file, "r") as f:
+                baseline = json.load(f)
+        else:
+            logger.warning(
+                f"No baseline at {baseline_file} to compare to, record one "
+                "on this machine with --update-baseline."
+            )
+
+    report = {}
+    for entry_point in entry_points:
+        times = time_entry_point(entry_point, top)
+        logger.info(
+            f"{entry_point}: {times['import_s']:.3f}s imports, "
+            f"{times['wall_s']:.3f}s wall."
+        )
+        report[entry_point] = times
+
+    logger.info(f"Writing import times to {output_file}.")
+    with open(output_file, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if update_baseline:
+        logger.info(f"Updating the baseline in {baseline_file}.")
+        with open(baseline_file, "w") as f:
+            json.dump(report, f, indent=2)
+        return
+
+    regressions = [
+        entry_point
+        for entry_point, times in report.items()
+        if entry_point in baseline
+        and times["import_s"] > tolerance * baseline[entry_point]["import_s"]
+    ]
+    for entry_point in regressions:
+        logger.error(
+            f"{entry_point} import time regressed: "
+            f"{baseline[entry_point]['import_s']:.3f}s -> "
+            f"{report[entry_point]['import_s']:.3f}s."
+        )
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import click
+import os
+
+from loguru import logger
+
+
+# One dtype per column name, shared by every pipeline stage so the same
+# column never drifts between stages.
+COLUMN_TYPES = {
+    "date": "datetime64[ns]",
+    "latitude": "float64",
+    "longitude": "float64",
+    "precip_type": "object",
+    "temperature_high": "float64",
+    "temperature_low": "float64",
+    "dew_point": "float64",
+    "humidity": "float64",
+    "cloud_cover": "float64",
+    "moon_phase": "float64",
+    "precip_intensity": "float64",
+    "precip_probability": "float64",
+    "pressure": "float64",
+    "uv_index": "float64",
+    "visibility": "float64",
+    "wind_bearing": "float64",
+    "wind_speed": "float64",
+    "sighting": "bool",
+    "hex_address": "object",
+    "hex_geojson": "object",
+    "coverage_resolution": "int64",
+    "historical_sightings": "int64",
+    "squatchcast": "float64",
+}
+
+SAMPLE_COLUMNS = ["date", "latitude", "longitude"]
+HEXAGON_COLUMNS = ["hex_address", "hex_geojson"]
+# Compacted coverage has mixed resolution cells and no boundaries.
+COMPACT_HEXAGON_COLUMNS = ["hex_address", "coverage_resolution"]
+# The squatchcast app joins the static hexagons to each day's forecast.
+SQUATCHCAST_HEXAGON_COLUMNS = HEXAGON_COLUMNS + [
+    "latitude",
+    "longitude",
+    "historical_sightings",
+]
+SQUATCHCAST_FORECAST_COLUMNS = [
+    "date",
+    "hex_address",
+    "squatchcast",
+    "temperature_high",
+    "precip_type",
+    "precip_probability",
+]
+
+
+def schema(columns):
+    return [(column, COLUMN_TYPES[column]) for column in columns]
+
+
+def normalize_nulls(frame):
+    """ Missing values in object columns as NaN, the way CSVs read back.
+        Parquet returns them as None, which sklearn's imputers don't treat
+        as missing.
+    """
+    import numpy as np
+
+    columns = {}
+    for column in frame.columns[frame.dtypes == object]:
+        values = frame[column].copy()
+        values[values.isnull()] = np.nan
+        columns[column] = values
+    return frame.assign(**columns) if columns else frame
+
+
+def apply_schema(frame, frame_schema):
+    """ Selects and casts the schema's columns, in the schema's order.
+    """
+    missing = [c for c, _ in frame_schema if c not in frame.columns]
+    if missing:
+        raise ValueError(f"Frame is missing columns {missing}.")
+    return normalize_nulls(
+        frame[[c for c, _ in frame_schema]].astype(dict(frame_schema))
+    )
+
+
+def file_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in {".parquet", ".feather", ".csv"}:
+        raise ValueError(f"Unsupported file format {extension} for {path}.")
+    return extension[1:]
+
+
+def read_frame(path, frame_schema=None):
+    import pandas as pd
+
+    # Directories are Parquet datasets, such as the weather store.
+    fmt = "parquet" if os.path.isdir(path) else file_format(path)
+    if fmt == "parquet":
+        frame = pd.read_parquet(path)
+    elif fmt == "feather":
+        frame = pd.read_feather(path)
+    else:
+        frame = pd.read_csv(path)
+
+    if frame_schema is not None:
+        return apply_schema(frame, frame_schema)
+    return normalize_nulls(frame)
+
+
+def write_frame(frame, path, frame_schema=None):
+    if frame_schema is not None:
+        frame = apply_schema(frame, frame_schema)
+
+    fmt = file_format(path)
+    if fmt == "parquet":
+        frame.to_parquet(path, index=False)
+    elif fmt == "feather":
+        # Feather can't store a non-default index.
+        frame.reset_index(drop=True).to_feather(path)
+    else:
+        frame.to_csv(path, index=False)
+
+
+class FrameWriter:
+    """ Appends frames to one Parquet or CSV file as they arrive, so large
+        outputs never have to be held in memory at once.
+    """
+
+    def __init__(self, path, frame_schema=None):
+        self.path = path
+        self.frame_schema = frame_schema
+        self.format = file_format(path)
+        if self.format == "feather":
+            raise ValueError("Feather files can't be written in pieces.")
+        self.parquet_writer = None
+        self.rows_written = 0
+
+    def write(self, frame):
+        if self.frame_schema is not None:
+            frame = apply_schema(frame, self.frame_schema)
+
+        if self.format == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self.parquet_writer is None:
+                self.parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self.parquet_writer.write_table(table)
+        else:
+            frame.to_csv(
+                self.path,
+                index=False,
+                mode="w" if self.rows_written == 0 else "a",
+                header=self.rows_written == 0,
+            )
+        self.rows_written += frame.shape[0]
+
+    def close(self):
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@click.command()
+@click.argument("input_file", type=click.Path(exists=True))
+@click.option("--output-file", "-o", type=click.Path(), required=True)
+def main(input_file, output_file):
+    """ Converts between interchange formats, e.g. Parquet -> CSV for tools
+        at the edges of the pipeline.
+    """
+    logger.info(f"Converting {input_file} to {output_file}.")
+    write_frame(read_frame(input_file), output_file)
+
+
+if __name__ == "__main__":
+    main()
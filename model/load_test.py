@@ -0,0 +1,226 @@
+import click
+import json
+import os
+import sys
+import tempfile
+
+from time import perf_counter
+from loguru import logger
+
+sys.path.append("./squatchcast")
+
+# Roughly the contiguous US.
+LATITUDES = (25.0, 49.0)
+LONGITUDES = (-124.0, -67.0)
+
+
+def start_server(latency_ms, jitter_ms, error_rate, rate_limit):
+    """ Runs the fake Dark Sky server on a free local port in a background
+        thread and returns its base URL.
+    """
+    import asyncio
+    import socket
+    import threading
+
+    from aiohttp import web
+
+    from fake_weather_server import make_app
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    ready = threading.Event()
+
+    def serve():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        runner = web.AppRunner(
+            make_app(latency_ms, jitter_ms, error_rate, rate_limit)
+        )
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(
+            web.TCPSite(runner, "127.0.0.1", port).start()
+        )
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    ready.wait()
+    return f"http://127.0.0.1:{port}"
+
+
+def random_locations(num_requests, rng):
+    latitudes = rng.uniform(*LATITUDES, size=num_requests).round(4)
+    longitudes = rng.uniform(*LONGITUDES, size=num_requests).round(4)
+    return latitudes, longitudes
+
+
+def historical_requests(num_requests, base_url, rng):
+    """ Time machine requests shaped like the ones fetch_weather.py makes.
+    """
+    import numpy as np
+
+    from fetch_weather import request_key
+    from weather import create_weather_request
+
+    latitudes, longitudes = random_locations(num_requests, rng)
+    dates = (
+        np.datetime64("2000-01-01")
+        + rng.integers(0, 7000, size=num_requests).astype("timedelta64[D]")
+    ).astype(str)
+    return [
+        (
+            request_key(date, latitude, longitude),
+            date,
+            latitude,
+            longitude,
+            create_weather_request(
+                latitude,
+                longitude,
+                date + "T00:00:00",
+                key="load-test",
+                base_url=base_url,
+            ),
+        )
+        for date, latitude, longitude in zip(dates, latitudes, longitudes)
+    ]
+
+
+def run_historical(requests, concurrency, retries, backoff, timeout):
+    """ Drives fetch_weather.fetch_all, journaling to a throwaway file. """
+    import asyncio
+
+    from fetch_weather import Journal, fetch_all
+
+    with tempfile.TemporaryDirectory() as scratch:
+        journal = Journal(os.path.join(scratch, "journal.jsonl"))
+        start = perf_counter()
+        try:
+            stats = asyncio.get_event_loop().run_until_complete(
+                fetch_all(
+                    requests, journal, concurrency, retries, backoff, timeout
+                )
+            )
+        finally:
+            journal.close()
+        return stats.summary(perf_counter() - start)
+
+
+def run_forecast(num_requests, base_url, rng):
+    """ Drives squatchcast's sequential forecast fetcher. """
+    import requests
+
+    from fetch_weather import FetchStats
+    from squatchcast import fetch_forecasts
+
+    latitudes, longitudes = random_locations(num_requests, rng)
+    stats = FetchStats()
+    start = perf_counter()
+    fetch_forecasts(
+        requests.Session(),
+        latitudes,
+        longitudes,
+        "load-test",
+        base_url=base_url,
+        stats=stats,
+    )
+    return stats.summary(perf_counter() - start)
+
+
+@click.command()
+@click.option("--num-requests", type=int, default=500)
+@click.option(
+    "--concurrency",
+    type=int,
+    multiple=True,
+    default=[1, 10, 50],
+    help="Repeat to sweep several concurrency levels.",
+)
+@click.option("--retries", type=int, default=3)
+@click.option("--backoff", type=float, default=0.1, help="Seconds.")
+@click.option("--timeout", type=float, default=30.0, help="Seconds.")
+@click.option(
+    "--num-forecast-requests",
+    type=int,
+    default=100,
+    help="Requests for the squatchcast fetcher; 0 skips it.",
+)
+@click.option(
+    "--base-url",
+    type=str,
+    default=None,
+    help="Target a running server instead of starting a local one.",
+)
+@click.option("--latency-ms", type=float, default=50.0)
+@click.option("--jitter-ms", type=float, default=25.0)
+@click.option("--error-rate", type=float, default=0.02)
+@click.option(
+    "--rate-limit", type=float, default=None, help="Requests per second."
+)
+@click.option("--seed", type=int, default=0)
+@click.option(
+    "--output-file",
+    type=click.Path(),
+    default="data/processed/load_test.json",
+)
+def main(
+    num_requests,
+    concurrency,
+    retries,
+    backoff,
+    timeout,
+    num_forecast_requests,
+    base_url,
+    latency_ms,
+    jitter_ms,
+    error_rate,
+    rate_limit,
+    seed,
+    output_file,
+):
+    """ Load tests the weather fetchers against the fake Dark Sky server and
+        reports throughput, tail latency and retry behaviour.
+    """
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    if base_url is None:
+        base_url = start_server(latency_ms, jitter_ms, error_rate, rate_limit)
+        logger.info(
+            f"Started fake Dark Sky at {base_url} ({latency_ms}±{jitter_ms} "
+            f"ms, {error_rate:.0%} errors, rate limit {rate_limit})."
+        )
+
+    results = []
+    requests = historical_requests(num_requests, base_url, rng)
+    for level in concurrency:
+        logger.info(
+            f"Fetching {num_requests} historical requests with concurrency "
+            f"{level}."
+        )
+        summary = run_historical(requests, level, retries, backoff, timeout)
+        results.append(
+            {"fetcher": "fetch_weather", "concurrency": level, **summary}
+        )
+
+    if num_forecast_requests:
+        logger.info(
+            f"Fetching {num_forecast_requests} forecasts with squatchcast."
+        )
+        summary = run_forecast(num_forecast_requests, base_url, rng)
+        results.append({"fetcher": "squatchcast", "concurrency": 1, **summary})
+
+    report = pd.DataFrame(results).drop(columns=["statuses"])
+    logger.info(
+        f"Load test results:\n{report.round(2).to_string(index=False)}"
+    )
+
+    logger.info(f"Writing load test report to {output_file}.")
+    with open(output_file, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
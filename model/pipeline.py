@@ -0,0 +1,486 @@
+import ast
+import click
+import hashlib
+import json
+import os
+import shlex
+import subprocess
+
+from time import perf_counter
+from loguru import logger
+
+
+# Scripts run from the repository root and import model modules by name.
+MODEL_DIR = "model"
+
+# Same knobs as the Makefile variables.
+PARAMS = {
+    "us_resolution": "3",
+    "us_compact": "",
+    # Empty simplifies for the finest of us_resolution and
+    # hex_map_resolution, the resolutions us.geojson is polyfilled at.
+    "us_simplify_resolution": "",
+    "synthesized_resolution": "11",
+    "min_synthesized_date": "1990-01-01",
+    "num_synthesized_samples": "4000",
+    "synthesized_seed": "0",
+    "synthesized_workers": "1",
+    "weather_coalesce_resolution": "",
+    "hex_map_resolution": "4",
+}
+
+SHAPEFILE = "data/external/cb_2016_us_state_500k"
+
+
+def simplify_resolution(params):
+    return params["us_simplify_resolution"] or str(
+        max(int(params["us_resolution"]), int(params["hex_map_resolution"]))
+    )
+
+
+class Stage:
+    """ One pipeline step: a command that turns inputs into outputs. Its
+        code is the script plus every local module it imports.
+    """
+
+    def __init__(self, name, command, inputs, outputs):
+        self.name = name
+        self.command = command
+        self.inputs = inputs
+        self.outputs = outputs
+
+    def command_line(self):
+        # shlex.join is 3.8+.
+        return " ".join(shlex.quote(arg) for arg in self.command)
+
+    def script(self):
+        return next((arg for arg in self.command if arg.endswith(".py")), None)
+
+    def __repr__(self):
+        return f"Stage({self.name})"
+
+
+def stages(params):
+    """ The Makefile's stages, parameterized by params. """
+    p = params
+    sightings = "data/raw/bigfoot_sightings.csv"
+    hexagons = "data/raw/us_hexagons.parquet"
+    synthesized = "data/raw/synthesized_not_sightings.parquet"
+    weather = "data/interim/synthesized_not_sightings.parquet"
+    raw_training = "data/processed/raw_training_data.parquet"
+
+    def hex_map(name, data_file):
+        return Stage(
+            name,
+            ["python", "analysis/hex_map.py", data_file, "data/raw/us.geojson"]
+            + ["--resolution", p["hex_map_resolution"]]
+            + ["--output-file", f"data/visualizations/{name}.html"],
+            [data_file, "data/raw/us.geojson"],
+            [f"data/visualizations/{name}.html"],
+        )
+
+    def point_map(name, data_file):
+        return Stage(
+            name,
+            ["python", "analysis/point_map.py", data_file]
+            + ["--output-file", f"data/visualizations/{name}.html"],
+            [data_file],
+            [f"data/visualizations/{name}.html"],
+        )
+
+    def svl_chart(name, data_file):
+        return Stage(
+            name,
+            ["svl", f"analysis/{name}.svl"]
+            + ["--dataset", f"bigfoot={data_file}"]
+            + ["--output-file", f"data/visualizations/{name}.html"]
+            + ["--no-browser"],
+            [data_file, f"analysis/{name}.svl"],
+            [f"data/visualizations/{name}.html"],
+        )
+
+    def export_csv(name, parquet_file):
+        csv_file = os.path.splitext(parquet_file)[0] + ".csv"
+        return Stage(
+            name,
+            ["python", "model/interchange.py", parquet_file]
+            + ["--output-file", csv_file],
+            [parquet_file],
+            [csv_file],
+        )
+
+    return [
+        Stage(
+            "us_geojson",
+            ["python", "model/us_shp_to_geojson.py", f"{SHAPEFILE}.shp"]
+            + ["--resolution", simplify_resolution(p)]
+            + ["--cache-dir", "data/interim/union_cache"]
+            + ["--output-file", "data/raw/us.geojson"],
+            [
+                f"{SHAPEFILE}{extension}"
+                for extension in [".shp", ".shx", ".dbf", ".prj"]
+            ],
+            ["data/raw/us.geojson"],
+        ),
+        Stage(
+            "hexagons",
+            ["python", "model/us_hexagons.py", "data/raw/us.geojson"]
+            + [sightings]
+            + ["--resolution", p["us_resolution"]]
+            + (["--compact"] if p["us_compact"] else [])
+            + ["--output-file", hexagons],
+            ["data/raw/us.geojson", sightings],
+            [hexagons],
+        ),
+        Stage(
+            "synthesize",
+            ["python", "model/synthesize.py"]
+            + ["--num-samples", p["num_synthesized_samples"]]
+            + ["--min-date", p["min_synthesized_date"]]
+            + ["--hexagon-file", hexagons]
+            + ["--location-resolution", p["synthesized_resolution"]]
+            + ["--seed", p["synthesized_seed"]]
+            + ["--workers", p["synthesized_workers"]]
+            + ["--output-file", synthesized],
+            [hexagons],
+            [synthesized],
+        ),
+        Stage(
+            "weather",
+            ["python", "model/fetch_weather.py", synthesized]
+            + ["--journal-file", "data/interim/weather_journal.jsonl"]
+            + ["--store-dir", "data/interim/weather_store"]
+            + ["--concurrency", "10"]
+            + (
+                ["--coalesce-resolution", p["weather_coalesce_resolution"]]
+                if p["weather_coalesce_resolution"]
+                else []
+            )
+            + ["--output-file", weather],
+            [synthesized],
+            [weather],
+        ),
+        Stage(
+            "assemble",
+            ["python", "model/assemble.py", sightings, weather]
+            + ["--output-file", raw_training],
+            [sightings, weather],
+            [raw_training],
+        ),
+        Stage(
+            "features",
+            ["python", "model/features.py", raw_training]
+            + ["--output-file", "data/processed/training_data.csv"],
+            [raw_training],
+            ["data/processed/training_data.csv"],
+        ),
+        Stage(
+            "train",
+            ["python", "model/train_model.py", raw_training]
+            + ["--model-file", "model/model.pkl"]
+            + ["--artifact-dir", "model/artifact"]
+            + ["--resolution", p["us_resolution"]],
+            [raw_training],
+            ["model/model.pkl", "model/artifact"],
+        ),
+        Stage(
+            "squatchcast",
+            ["python", "squatchcast/squatchcast.py"]
+            + ["--us-hexagons", hexagons]
+            + ["--historical-sightings", sightings]
+            + ["--model-artifact", "model/artifact"]
+            + ["--hexagon-file", "data/squatchcast/hexagons.parquet"]
+            + ["--forecast-file", "data/squatchcast/forecast.parquet"],
+            [hexagons, sightings, "model/artifact"],
+            [
+                "data/squatchcast/hexagons.parquet",
+                "data/squatchcast/forecast.parquet",
+            ],
+        ),
+        export_csv("raw_training_data_csv", raw_training),
+        export_csv("synthesized_csv", synthesized),
+        point_map("sightings_point_map", sightings),
+        point_map(
+            "not_sightings_point_map",
+            "data/raw/synthesized_not_sightings.csv",
+        ),
+        hex_map("sighting_hex_map", sightings),
+        hex_map(
+            "not_sighting_hex_map", "data/raw/synthesized_not_sightings.csv"
+        ),
+        svl_chart("raw_training_data", "data/processed/raw_training_data.csv"),
+        svl_chart("training_data", "data/processed/training_data.csv"),
+    ]
+
+
+VISUALIZATIONS = [
+    "sightings_point_map",
+    "not_sightings_point_map",
+    "sighting_hex_map",
+    "not_sighting_hex_map",
+    "raw_training_data",
+    "training_data",
+]
+
+
+def local_imports(script, search_dirs):
+    """ Every local module script imports, following imports transitively.
+        Imports inside functions count; the scripts defer most of theirs.
+    """
+    found = set()
+    pending = [script]
+    while pending:
+        path = pending.pop()
+        if path in found:
+            continue
+        found.add(path)
+        with open(path, "r") as f:
+            tree = ast.parse(f.read(), filename=path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                for directory in [os.path.dirname(path)] + search_dirs:
+                    candidate = os.path.join(directory, f"{name}.py")
+                    if os.path.exists(candidate):
+                        pending.append(candidate)
+                        break
+    return sorted(found)
+
+
+class FileHasher:
+    """ Content hashes keyed by (size, mtime) so unchanged files, like the
+        shapefile, aren't reread on every run.
+    """
+
+    def __init__(self, known=None):
+        self.known = dict(known or {})
+
+    def file_hash(self, path):
+        status = os.stat(path)
+        cached = self.known.get(path)
+        if cached and cached[:2] == [status.st_size, status.st_mtime_ns]:
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        self.known[path] = [
+            status.st_size,
+            status.st_mtime_ns,
+            digest.hexdigest(),
+        ]
+        return digest.hexdigest()
+
+    def path_hash(self, path):
+        """ Hash of a file, a directory's files, or a marker if missing. """
+        if os.path.isdir(path):
+            digest = hashlib.sha256()
+            for root, _, names in sorted(os.walk(path)):
+                for name in sorted(names):
+                    child = os.path.join(root, name)
+                    digest.update(child.encode())
+                    digest.update(self.file_hash(child).encode())
+            return digest.hexdigest()
+        if not os.path.exists(path):
+            return "missing"
+        return self.file_hash(path)
+
+
+def stage_digest(stage, hasher):
+    """ Hash of a stage's inputs, code and command line (its params). """
+    digest = hashlib.sha256(stage.command_line().encode())
+    code = []
+    if stage.script() is not None:
+        code = local_imports(stage.script(), [MODEL_DIR])
+    for path in sorted(set(stage.inputs)) + code:
+        digest.update(path.encode())
+        digest.update(hasher.path_hash(path).encode())
+    return digest.hexdigest()
+
+
+class PipelineState:
+    """ The last successful digest for each stage, kept in a JSON file. """
+
+    def __init__(self, state_file):
+        self.state_file = state_file
+        self.state = {"stages": {}, "files": {}}
+        if os.path.exists(state_file):
+            with open(state_file, "r") as f:
+                self.state = json.load(f)
+        self.hasher = FileHasher(self.state["files"])
+
+    def is_fresh(self, stage, digest):
+        return self.state["stages"].get(stage.name) == digest and all(
+            os.path.exists(output) for output in stage.outputs
+        )
+
+    def record(self, stage, digest):
+        self.state["stages"][stage.name] = digest
+        self.save()
+
+    def save(self):
+        self.state["files"] = self.hasher.known
+        os.makedirs(os.path.dirname(self.state_file) or ".", exist_ok=True)
+        with open(self.state_file, "w") as f:
+            json.dump(self.state, f, indent=2, sort_keys=True)
+
+
+def dependencies(all_stages):
+    producers = {
+        output: stage.name for stage in all_stages for output in stage.outputs
+    }
+    return {
+        stage.name: {
+            producers[path] for path in stage.inputs if path in producers
+        }
+        for stage in all_stages
+    }
+
+
+def select(all_stages, targets):
+    """ The target stages and everything upstream of them. """
+    depends_on = dependencies(all_stages)
+    unknown = set(targets) - set(depends_on)
+    if unknown:
+        raise click.BadParameter(f"Unknown stages {sorted(unknown)}.")
+    selected = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(depends_on[name])
+    return [stage for stage in all_stages if stage.name in selected]
+
+
+def run_stage(stage):
+    start = perf_counter()
+    for output in stage.outputs:
+        if os.path.splitext(output)[1]:
+            os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    result = subprocess.run(stage.command)
+    return result.returncode, perf_counter() - start
+
+
+def run_pipeline(selected, state, jobs, force=False, dry_run=False):
+    """ Runs each stage once everything it depends on has finished, up to
+        jobs at a time, skipping stages whose digest hasn't changed.
+        Returns the names of stages that failed or were blocked.
+    """
+    from concurrent.futures import (
+        FIRST_COMPLETED,
+        ThreadPoolExecutor,
+        wait,
+    )
+
+    by_name = {stage.name: stage for stage in selected}
+    depends_on = {
+        name: deps & set(by_name)
+        for name, deps in dependencies(selected).items()
+    }
+    pending = list(by_name)
+    done, failed = set(), set()
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            for name in list(pending):
+                if depends_on[name] & failed:
+                    logger.error(f"Skipping {name}, an upstream stage failed.")
+                    pending.remove(name)
+                    failed.add(name)
+                elif depends_on[name] <= done:
+                    pending.remove(name)
+                    stage = by_name[name]
+                    # Hashed only now, after upstream stages rewrote inputs.
+                    digest = stage_digest(stage, state.hasher)
+                    if not force and state.is_fresh(stage, digest):
+                        logger.info(f"{name} is up to date.")
+                        done.add(name)
+                    elif dry_run:
+                        logger.info(f"Would run {stage.command_line()}")
+                        done.add(name)
+                    else:
+                        logger.info(f"Running {stage.command_line()}")
+                        future = executor.submit(run_stage, stage)
+                        running[future] = (stage, digest)
+            if not running:
+                # Fresh or dry run stages may have unblocked others.
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, digest = running.pop(future)
+                returncode, elapsed = future.result()
+                if returncode == 0:
+                    logger.info(f"{stage.name} finished in {elapsed:.1f}s.")
+                    # Digest the outputs later stages will read.
+                    state.record(stage, digest)
+                    done.add(stage.name)
+                else:
+                    logger.error(
+                        f"{stage.name} failed with exit code {returncode}."
+                    )
+                    failed.add(stage.name)
+    state.save()
+    return failed
+
+
+@click.command()
+@click.argument("targets", nargs=-1)
+@click.option("--jobs", "-j", type=int, default=os.cpu_count())
+@click.option(
+    "--param",
+    "-p",
+    "param_values",
+    multiple=True,
+    help="Override a parameter, e.g. -p us_resolution=4.",
+)
+@click.option(
+    "--state-file",
+    type=click.Path(),
+    default="data/interim/pipeline_state.json",
+)
+@click.option("--force", is_flag=True, help="Rerun even up to date stages.")
+@click.option("--dry-run", "-n", is_flag=True)
+@click.option("--list", "list_stages", is_flag=True)
+def main(targets, jobs, param_values, state_file, force, dry_run, list_stages):
+    """ Runs the pipeline up to TARGETS (stage names, or "visualizations"),
+        defaulting to everything. Stages are cached on a hash of their
+        inputs, code and parameters, and independent ones run in parallel.
+    """
+    params = dict(PARAMS)
+    for value in param_values:
+        key, _, value = value.partition("=")
+        if key not in params:
+            raise click.BadParameter(f"Unknown parameter {key}.")
+        params[key] = value
+
+    all_stages = stages(params)
+    if list_stages:
+        for stage in all_stages:
+            print(f"{stage.name}: {' '.join(stage.outputs)}")
+        return
+
+    names = []
+    for target in targets or [stage.name for stage in all_stages]:
+        if target == "visualizations":
+            names.extend(VISUALIZATIONS)
+        else:
+            names.append(target)
+    selected = select(all_stages, names)
+
+    state = PipelineState(state_file)
+    failed = run_pipeline(selected, state, jobs, force, dry_run)
+    if failed:
+        logger.error(f"Failed stages: {', '.join(sorted(failed))}.")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
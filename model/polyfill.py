@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+
+from loguru import logger
+from interchange import read_frame, schema, write_frame
+
+
+# Polygons wider than this many degrees are split into tiles before
+# polyfilling, so one huge state doesn't hold up the rest.
+TILE_SIZE = 5.0
+
+
+def polygons(geometry):
+    """ The polygons in a (multi)polygon or geometry collection. """
+    if geometry.geom_type == "Polygon":
+        # Tiling can leave empty or degenerate slivers.
+        return [geometry] if geometry.area > 0 else []
+    return [
+        polygon
+        for part in getattr(geometry, "geoms", [])
+        for polygon in polygons(part)
+    ]
+
+
+def tile(polygon, tile_size):
+    """ Splits a polygon along a tile_size degree grid. Every cell centroid
+        falls in exactly one piece, so polyfilling the pieces gives the same
+        cells as polyfilling the whole polygon.
+    """
+    import numpy as np
+
+    from shapely.geometry import box
+
+    min_x, min_y, max_x, max_y = polygon.bounds
+    if max(max_x - min_x, max_y - min_y) <= tile_size:
+        return [polygon]
+
+    pieces = []
+    for x in np.arange(min_x, max_x, tile_size):
+        for y in np.arange(min_y, max_y, tile_size):
+            piece = polygon.intersection(
+                box(x, y, x + tile_size, y + tile_size)
+            )
+            pieces.extend(polygons(piece))
+    return pieces
+
+
+def _polyfill(args):
+    from h3 import h3
+
+    geojson, resolution = args
+    return h3.polyfill(geojson, resolution, geo_json_conformant=True)
+
+
+def polyfill(geometry, resolution, workers, tile_size=TILE_SIZE):
+    from multiprocessing import Pool
+    from shapely.geometry import mapping
+    from tqdm import tqdm
+
+    pieces = [
+        mapping(piece)
+        for polygon in polygons(geometry)
+        for piece in tile(polygon, tile_size)
+    ]
+    logger.info(f"Polyfilling {len(pieces)} pieces on {workers} workers.")
+    hexes = set()
+    with Pool(workers) as pool:
+        for piece_hexes in tqdm(
+            pool.imap_unordered(
+                _polyfill, [(piece, resolution) for piece in pieces]
+            ),
+            total=len(pieces),
+        ):
+            hexes |= piece_hexes
+    return hexes
+
+
+def cached_polyfill(
+    polygon_text,
+    resolution,
+    workers,
+    tile_size=TILE_SIZE,
+    cache_dir="data/interim/polyfill_cache",
+):
+    """ Polyfill of the polygon GeoJSON text, cached by a hash of the text
+        and the resolution.
+    """
+    import pandas as pd
+
+    from shapely.geometry import shape
+
+    polygon_hash = hashlib.sha256(polygon_text.encode("utf-8")).hexdigest()
+    cache_file = os.path.join(
+        cache_dir, f"polyfill_{polygon_hash[:16]}_r{resolution}.parquet"
+    )
+    if os.path.exists(cache_file):
+        logger.info(f"Reusing cached polyfill {cache_file}.")
+        return set(read_frame(cache_file).hex_address)
+
+    hexes = polyfill(
+        shape(json.loads(polygon_text)), resolution, workers, tile_size
+    )
+    os.makedirs(cache_dir, exist_ok=True)
+    write_frame(
+        pd.DataFrame({"hex_address": sorted(hexes)}),
+        cache_file,
+        schema(["hex_address"]),
+    )
+    return hexes
@@ -0,0 +1,93 @@
+import cProfile
+import json
+import pstats
+import resource
+import sys
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import perf_counter, process_time
+from loguru import logger
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class StageProfiler:
+    """ Records wall time, CPU time and peak RSS per named stage. Stages
+        entered more than once accumulate. With profile=True each stage also
+        runs under cProfile so the hottest one can be dumped afterwards.
+    """
+
+    def __init__(self, profile=False):
+        self.profile = profile
+        self.stages = OrderedDict()
+        self.profiles = {}
+
+    @contextmanager
+    def stage(self, name):
+        profile = cProfile.Profile() if self.profile else None
+        start_wall = perf_counter()
+        start_cpu = process_time()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            wall = perf_counter() - start_wall
+            cpu = process_time() - start_cpu
+
+            record = self.stages.setdefault(
+                name, {"wall_s": 0.0, "cpu_s": 0.0, "calls": 0}
+            )
+            record["wall_s"] += wall
+            record["cpu_s"] += cpu
+            record["calls"] += 1
+            # ru_maxrss is a high water mark for the whole process, so this
+            # is the peak as of the end of the stage.
+            record["peak_rss_mb"] = peak_rss_mb()
+            logger.info(f"Stage {name} took {wall:.3f}s ({cpu:.3f}s CPU).")
+
+            if profile is not None:
+                if name in self.profiles:
+                    self.profiles[name].add(profile)
+                else:
+                    self.profiles[name] = pstats.Stats(profile)
+
+    def hottest_stage(self):
+        return max(self.stages, key=lambda name: self.stages[name]["wall_s"])
+
+    def report(self):
+        return {
+            "stages": self.stages,
+            "hottest_stage": self.hottest_stage() if self.stages else None,
+            "total_wall_s": sum(s["wall_s"] for s in self.stages.values()),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+    def metrics(self):
+        metrics = {}
+        for name, record in self.stages.items():
+            metrics[f"{name}_wall_s"] = record["wall_s"]
+            metrics[f"{name}_cpu_s"] = record["cpu_s"]
+            metrics[f"{name}_peak_rss_mb"] = record["peak_rss_mb"]
+        return metrics
+
+    def write_report(self, report_file):
+        with open(report_file, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def dump_hottest(self, profile_file):
+        """ Writes the hottest stage's cProfile stats, readable by pstats,
+            snakeviz and friends.
+        """
+        hottest = self.hottest_stage()
+        if hottest not in self.profiles:
+            raise ValueError("Stages were not run with profile=True.")
+        self.profiles[hottest].dump_stats(profile_file)
+        return hottest
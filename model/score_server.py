@@ -0,0 +1,293 @@
+import click
+import sys
+
+from collections import deque
+from time import perf_counter
+from loguru import logger
+
+sys.path.append("./model")
+
+
+# Latency and batch size percentiles cover this many recent requests.
+STATS_WINDOW = 10000
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def rows_to_columns(rows, raw_features):
+    """ Turns a list of row dicts into the dict of arrays the model scores.
+        Missing weather values become NaN, which the booster treats as
+        missing; date, latitude and longitude are required. Raises
+        ValueError for anything that can't be scored.
+    """
+    import numpy as np
+
+    missing = [
+        feature
+        for feature in ["date", "latitude", "longitude"]
+        for row in rows
+        if row.get(feature) is None
+    ]
+    if missing:
+        raise ValueError(f"Rows are missing {sorted(set(missing))}.")
+
+    for row in rows:
+        if not isinstance(row["date"], str):
+            raise ValueError("date must be a YYYY-MM-DD string.")
+        if not (_is_number(row["latitude"]) and -90 <= row["latitude"] <= 90):
+            raise ValueError("latitude must be a number in [-90, 90].")
+        if not (
+            _is_number(row["longitude"]) and -180 <= row["longitude"] <= 180
+        ):
+            raise ValueError("longitude must be a number in [-180, 180].")
+        precip_type = row.get("precip_type")
+        if precip_type is not None and not isinstance(precip_type, str):
+            raise ValueError("precip_type must be a string.")
+        for feature in raw_features[4:]:
+            value = row.get(feature)
+            if value is not None and not _is_number(value):
+                raise ValueError(f"{feature} must be a number.")
+
+    try:
+        dates = np.array(
+            [row["date"][:10] for row in rows], dtype="datetime64[D]"
+        )
+    except ValueError:
+        raise ValueError("date must be a YYYY-MM-DD string.")
+    columns = {
+        "date": dates,
+        "precip_type": np.array(
+            [row.get("precip_type") for row in rows], dtype=object
+        ),
+    }
+    for feature in raw_features:
+        if feature not in columns:
+            columns[feature] = np.array(
+                [
+                    np.nan if row.get(feature) is None else row[feature]
+                    for row in rows
+                ],
+                dtype=float,
+            )
+    return columns
+
+
+class ServiceStats:
+    def __init__(self, window=STATS_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+        self.errors = 0
+
+    def summary(self):
+        import numpy as np
+
+        latencies = np.array(self.latencies) * 1000
+        batch_sizes = np.array(self.batch_sizes)
+        p50, p99 = (
+            np.percentile(latencies, [50, 99])
+            if latencies.size
+            else (np.nan,) * 2
+        )
+        return {
+            "requests": self.requests,
+            "rows": self.rows,
+            "batches": self.batches,
+            "errors": self.errors,
+            "p50_ms": float(p50),
+            "p99_ms": float(p99),
+            "mean_batch_size": float(batch_sizes.mean())
+            if batch_sizes.size
+            else 0.0,
+            "max_batch_size": int(batch_sizes.max())
+            if batch_sizes.size
+            else 0,
+        }
+
+
+class MicroBatcher:
+    """ Collects the rows of concurrent requests into one predict_proba
+        call. A batch is scored once it has max_batch_size rows or its first
+        request has waited max_wait_ms, whichever comes first.
+    """
+
+    def __init__(self, model, max_batch_size=256, max_wait_ms=5.0):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = None
+        self.stats = ServiceStats()
+
+    def start(self):
+        """ Starts scoring on the running loop, returning the task. """
+        import asyncio
+
+        # The queue belongs to the loop that serves the requests.
+        self.queue = asyncio.Queue()
+        return asyncio.get_event_loop().create_task(self.run())
+
+    async def score(self, rows):
+        import asyncio
+
+        columns = rows_to_columns(rows, self.model.raw_features)
+        future = asyncio.get_event_loop().create_future()
+        await self.queue.put((len(rows), columns, future))
+        return await future
+
+    async def _collect(self):
+        import asyncio
+
+        loop = asyncio.get_event_loop()
+        batch = [await self.queue.get()]
+        size = batch[0][0]
+        deadline = loop.time() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            size += item[0]
+        return batch, size
+
+    def _predict(self, batch):
+        import numpy as np
+
+        columns = {
+            feature: np.concatenate([item[1][feature] for item in batch])
+            for feature in batch[0][1]
+        }
+        return self.model.predict_proba(columns)[:, 1]
+
+    async def run(self):
+        """ Scores batches until cancelled. Prediction runs in a thread so
+            the next batch keeps filling while this one is scored.
+        """
+        import asyncio
+        import numpy as np
+
+        loop = asyncio.get_event_loop()
+        while True:
+            batch, size = await self._collect()
+            try:
+                scores = await loop.run_in_executor(
+                    None, self._predict, batch
+                )
+            except Exception as e:
+                self.stats.errors += len(batch)
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.stats.batches += 1
+            self.stats.batch_sizes.append(size)
+            offsets = np.cumsum([0] + [item[0] for item in batch])
+            for (_, _, future), start, end in zip(
+                batch, offsets[:-1], offsets[1:]
+            ):
+                # The request may have been dropped while it waited.
+                if not future.done():
+                    future.set_result(scores[start:end].tolist())
+
+
+def make_app(model, max_batch_size=256, max_wait_ms=5.0):
+    """ An aiohttp app that scores POST /score bodies, either one row object
+        or {"rows": [...]}, and reports GET /stats.
+    """
+    from aiohttp import web
+
+    batcher = MicroBatcher(model, max_batch_size, max_wait_ms)
+
+    async def score(request):
+        start = perf_counter()
+        try:
+            body = await request.json()
+        except ValueError:
+            return web.json_response(
+                {"error": "body must be JSON"}, status=400
+            )
+        if isinstance(body, dict) and "rows" in body:
+            rows = body["rows"]
+        else:
+            rows = [body]
+        if (
+            not isinstance(rows, list)
+            or not rows
+            or not all(isinstance(row, dict) for row in rows)
+        ):
+            return web.json_response(
+                {"error": "expected a row object or a list of rows"},
+                status=400,
+            )
+        try:
+            scores = await batcher.score(rows)
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+        batcher.stats.requests += 1
+        batcher.stats.rows += len(rows)
+        batcher.stats.latencies.append(perf_counter() - start)
+        return web.json_response({"squatchcast": scores})
+
+    async def stats(request):
+        return web.json_response(batcher.stats.summary())
+
+    async def start_batcher(app):
+        app["batcher"] = batcher.start()
+
+    async def stop_batcher(app):
+        app["batcher"].cancel()
+
+    app = web.Application()
+    app.router.add_post("/score", score)
+    app.router.add_get("/stats", stats)
+    app.on_startup.append(start_batcher)
+    app.on_cleanup.append(stop_batcher)
+    return app
+
+
+@click.command()
+@click.option(
+    "--model-artifact", type=click.Path(exists=True), default="model/artifact"
+)
+@click.option("--host", type=str, default="127.0.0.1")
+@click.option("--port", type=int, default=8766)
+@click.option(
+    "--max-batch-size",
+    type=int,
+    default=256,
+    help="Score a batch once it has this many rows.",
+)
+@click.option(
+    "--max-wait-ms",
+    type=float,
+    default=5.0,
+    help="Score a batch once its first request has waited this long.",
+)
+def main(model_artifact, host, port, max_batch_size, max_wait_ms):
+    """ Scores ad hoc (date, latitude, longitude, weather) rows over HTTP,
+        batching concurrent requests into one prediction.
+    """
+    from aiohttp import web
+
+    from artifact import load_artifact
+
+    logger.info(f"Loading model artifact from {model_artifact}.")
+    model = load_artifact(model_artifact)
+    logger.info(
+        f"Serving squatchcast scores at http://{host}:{port}/score, "
+        f"batches of up to {max_batch_size} rows or {max_wait_ms}ms."
+    )
+    web.run_app(
+        make_app(model, max_batch_size, max_wait_ms), host=host, port=port
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+import hashlib
+import os
+
+import numpy as np
+
+from loguru import logger
+from h3_int import MAX_RESOLUTION, to_int, to_str
+
+
+RESOLUTIONS = list(range(MAX_RESOLUTION + 1))
+
+
+class SightingIndex:
+    """ Point counts per H3 cell at several resolutions. Each resolution is
+        a sorted uint64 array of cells with a parallel array of counts, so
+        a lookup is a binary search and a whole batch is one searchsorted.
+    """
+
+    def __init__(self, cells, counts):
+        # Both are dicts of resolution -> array.
+        self.cells = cells
+        self.counts = counts
+
+    @classmethod
+    def from_points(cls, latitudes, longitudes, resolutions=RESOLUTIONS):
+        from h3 import h3
+
+        cells, counts = {}, {}
+        for resolution in resolutions:
+            # Points are indexed at each resolution rather than taking
+            # parents of the finest cell: H3 children don't nest exactly,
+            # and consumers index new points with geo_to_h3.
+            point_cells = to_int(
+                h3.geo_to_h3(latitude, longitude, resolution)
+                for latitude, longitude in zip(latitudes, longitudes)
+            )
+            cells[resolution], counts[resolution] = np.unique(
+                point_cells, return_counts=True
+            )
+        return cls(cells, counts)
+
+    @property
+    def resolutions(self):
+        return sorted(self.cells)
+
+    def _check(self, resolution):
+        if resolution not in self.cells:
+            raise ValueError(
+                f"Resolution {resolution} isn't indexed, only "
+                f"{self.resolutions}."
+            )
+
+    def lookup(self, cells, resolution):
+        """ Counts for an array of uint64 cells, zero where there are none.
+        """
+        self._check(resolution)
+        indexed = self.cells[resolution]
+        cells = np.asarray(cells, dtype=np.uint64)
+        if indexed.size == 0:
+            return np.zeros(cells.shape, dtype=np.int64)
+        positions = np.searchsorted(indexed, cells)
+        clipped = np.minimum(positions, indexed.size - 1)
+        return np.where(
+            indexed[clipped] == cells, self.counts[resolution][clipped], 0
+        )
+
+    def lookup_points(self, latitudes, longitudes, resolution):
+        from h3 import h3
+
+        cells = to_int(
+            h3.geo_to_h3(latitude, longitude, resolution)
+            for latitude, longitude in zip(latitudes, longitudes)
+        )
+        return self.lookup(cells, resolution)
+
+    def ring_counts(self, cells, resolution, k):
+        """ Total count within k rings of each cell, one searchsorted over
+            all the neighbors at once.
+        """
+        from h3 import h3
+
+        rings = [h3.k_ring(cell, k) for cell in to_str(np.asarray(cells))]
+        if not rings:
+            return np.zeros(0, dtype=np.int64)
+        neighbors = to_int(cell for ring in rings for cell in ring)
+        starts = np.cumsum([0] + [len(ring) for ring in rings[:-1]])
+        return np.add.reduceat(self.lookup(neighbors, resolution), starts)
+
+    def hex_addresses(self, resolution):
+        self._check(resolution)
+        return to_str(self.cells[resolution])
+
+    def to_frame(self, resolution):
+        import pandas as pd
+
+        return pd.DataFrame(
+            {
+                "hex_address": self.hex_addresses(resolution),
+                "count": self.counts[resolution],
+            }
+        )
+
+    def add(self, other):
+        """ A new index with the counts of both, over shared resolutions.
+        """
+        cells, counts = {}, {}
+        for resolution in set(self.cells) & set(other.cells):
+            both = np.concatenate(
+                [self.cells[resolution], other.cells[resolution]]
+            )
+            cells[resolution], inverse = np.unique(both, return_inverse=True)
+            counts[resolution] = np.bincount(
+                inverse,
+                weights=np.concatenate(
+                    [self.counts[resolution], other.counts[resolution]]
+                ),
+            ).astype(np.int64)
+        return SightingIndex(cells, counts)
+
+    def save(self, path):
+        arrays = {}
+        for resolution in self.resolutions:
+            arrays[f"cells_{resolution}"] = self.cells[resolution]
+            arrays[f"counts_{resolution}"] = self.counts[resolution]
+        # Write then rename so a crash never leaves a partial index.
+        temporary = path + ".tmp.npz"
+        np.savez(temporary, **arrays)
+        os.rename(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        cells, counts = {}, {}
+        with np.load(path) as arrays:
+            for name in arrays.files:
+                kind, resolution = name.rsplit("_", 1)
+                target = cells if kind == "cells" else counts
+                target[int(resolution)] = arrays[name]
+        return cls(cells, counts)
+
+
+def cached_sighting_index(
+    points_file, cache_dir="data/interim/sighting_index"
+):
+    """ The index for every resolution of a points file (sightings or
+        synthesized samples), built once per file contents and shared by
+        every consumer.
+    """
+    from interchange import read_frame
+
+    digest = hashlib.sha256()
+    with open(points_file, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    cache_file = os.path.join(
+        cache_dir, f"sightings_{digest.hexdigest()[:16]}.npz"
+    )
+    if os.path.exists(cache_file):
+        logger.info(f"Reusing sighting index {cache_file}.")
+        return SightingIndex.load(cache_file)
+
+    points = read_frame(points_file).query("~latitude.isnull()")
+    logger.info(f"Indexing {points.shape[0]} points from {points_file}.")
+    index = SightingIndex.from_points(
+        points.latitude.values, points.longitude.values
+    )
+    os.makedirs(cache_dir, exist_ok=True)
+    index.save(cache_file)
+    return index
+
+
+def month_number(dates):
+    """ Months since January 1970 for an array of dates. """
+    return (
+        np.asarray(dates)
+        .astype("datetime64[D]")
+        .astype("datetime64[M]")
+        .astype(np.int64)
+    )
+
+
+class SightingCube:
+    """ Sighting counts per H3 cell and month at one resolution. Counts are
+        stored as cumulative sums along the months, so the count over any
+        window of months is two lookups and a subtraction.
+    """
+
+    def __init__(self, resolution, cells, first_month, cumulative):
+        self.resolution = resolution
+        # Sorted uint64 cells, one row of cumulative each.
+        self.cells = cells
+        self.first_month = first_month
+        # cumulative[i, m] is the count for cells[i] before first_month + m.
+        self.cumulative = cumulative
+
+    @classmethod
+    def from_counts(cls, resolution, cells, first_month, counts):
+        cumulative = np.zeros(
+            (counts.shape[0], counts.shape[1] + 1), dtype=np.int64
+        )
+        np.cumsum(counts, axis=1, out=cumulative[:, 1:])
+        return cls(resolution, cells, first_month, cumulative)
+
+    @classmethod
+    def from_points(cls, dates, latitudes, longitudes, resolution):
+        from h3 import h3
+
+        point_cells = to_int(
+            h3.geo_to_h3(latitude, longitude, resolution)
+            for latitude, longitude in zip(latitudes, longitudes)
+        )
+        months = month_number(dates)
+        if months.size == 0:
+            return cls.from_counts(
+                resolution,
+                point_cells,
+                0,
+                np.zeros((0, 0), dtype=np.int64),
+            )
+        cells, rows = np.unique(point_cells, return_inverse=True)
+        first_month = int(months.min())
+        counts = np.zeros(
+            (cells.size, int(months.max()) - first_month + 1), dtype=np.int64
+        )
+        np.add.at(counts, (rows, months - first_month), 1)
+        return cls.from_counts(resolution, cells, first_month, counts)
+
+    @property
+    def num_months(self):
+        return self.cumulative.shape[1] - 1
+
+    def counts(self):
+        return np.diff(self.cumulative, axis=1)
+
+    def window_counts(self, cells, start_months, end_months):
+        """ Counts for each cell in months [start, end), zero for cells or
+            months the cube has never seen.
+        """
+        cells = np.asarray(cells, dtype=np.uint64)
+        if self.cells.size == 0:
+            return np.zeros(cells.shape, dtype=np.int64)
+        rows = np.minimum(
+            np.searchsorted(self.cells, cells), self.cells.size - 1
+        )
+        found = self.cells[rows] == cells
+        start = np.clip(
+            np.asarray(start_months) - self.first_month, 0, self.num_months
+        )
+        end = np.clip(
+            np.asarray(end_months) - self.first_month, 0, self.num_months
+        )
+        counts = self.cumulative[rows, end] - self.cumulative[rows, start]
+        return np.where(found & (end > start), counts, 0)
+
+    def trailing_counts(self, dates, latitudes, longitudes, window_months):
+        """ Counts in each point's cell over the window_months before the
+            point's month, not including the month itself.
+        """
+        from h3 import h3
+
+        cells = to_int(
+            h3.geo_to_h3(latitude, longitude, self.resolution)
+            for latitude, longitude in zip(latitudes, longitudes)
+        )
+        months = month_number(dates)
+        return self.window_counts(cells, months - window_months, months)
+
+    def add(self, other):
+        """ A new cube with the counts of both over the union of their
+            cells and months.
+        """
+        if other.cells.size == 0:
+            return self
+        if self.cells.size == 0:
+            return other
+        cells = np.union1d(self.cells, other.cells)
+        first_month = min(self.first_month, other.first_month)
+        last_month = max(
+            self.first_month + self.num_months,
+            other.first_month + other.num_months,
+        )
+        counts = np.zeros((cells.size, last_month - first_month), np.int64)
+        for cube in [self, other]:
+            rows = np.searchsorted(cells, cube.cells)
+            offset = cube.first_month - first_month
+            counts[rows, offset:offset + cube.num_months] += cube.counts()
+        return SightingCube.from_counts(
+            self.resolution, cells, first_month, counts
+        )
+
+    def save(self, path):
+        np.savez(
+            path,
+            resolution=self.resolution,
+            cells=self.cells,
+            first_month=self.first_month,
+            cumulative=self.cumulative,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls(
+                int(arrays["resolution"]),
+                arrays["cells"],
+                int(arrays["first_month"]),
+                arrays["cumulative"],
+            )
@@ -1,36 +1,133 @@
 import click
-import random
-import pandas as pd
-import csv
 
-from datetime import datetime, timedelta
-from h3 import h3
-from tqdm import tqdm
+from datetime import datetime
+from loguru import logger
+from chunking import chunk_sizes
+from interchange import SAMPLE_COLUMNS, FrameWriter, read_frame, schema
 
 
-def random_date(min_date, max_date):
-    total_days = (max_date - min_date).days
-    days_forward = random.randint(0, total_days)
+def sample_dates(min_date, max_date, num_samples, rng):
+    import numpy as np
 
-    return (min_date + timedelta(days=days_forward)).date()
+    min_day = np.datetime64(min_date, "D")
+    total_days = (np.datetime64(max_date, "D") - min_day).astype(int)
+    return min_day + rng.integers(0, total_days + 1, size=num_samples)
 
 
-def random_location(candidate_hex_addresses, resolution):
-    root_hex = random.choice(candidate_hex_addresses)
-    root_resolution = h3.h3_get_resolution(root_hex)
+def sample_locations(candidate_hex_addresses, resolution, num_samples, rng):
+    """ Draws a root hexagon for each sample, then a uniformly random
+        descendant of it at resolution. Returns lat / lon arrays.
+    """
+    import numpy as np
 
-    current_resolution = root_resolution
-    current_cell = root_hex
+    from h3 import h3
+    from h3_int import get_resolution, random_children, to_int, to_str
 
-    while current_resolution < resolution:
-        # Step up one resolution.
-        current_resolution += 1
-        # Get all the children of the current cell.
-        children = h3.h3_to_children(current_cell, current_resolution)
-        # Draw a random child and set it to the current cell.
-        current_cell = random.choice(list(children))
+    candidates = list(candidate_hex_addresses)
+    roots = to_int(candidates)
+    is_pentagon = np.array([h3.h3_is_pentagon(c) for c in candidates])
 
-    return h3.h3_to_geo(current_cell)
+    root_resolutions = get_resolution(roots)
+    if (root_resolutions == root_resolutions[0]).all():
+        draws = rng.integers(0, len(candidates), size=num_samples)
+    else:
+        # Compacted coverage mixes resolutions, so weight each root by its
+        # number of descendants (ignoring the few pentagons) to keep the
+        # locations uniform over area.
+        weights = 7.0 ** (resolution - root_resolutions)
+        draws = rng.choice(
+            len(candidates), size=num_samples, p=weights / weights.sum()
+        )
+    cells = random_children(roots[draws], is_pentagon[draws], resolution, rng)
+
+    coordinates = np.array([h3.h3_to_geo(cell) for cell in to_str(cells)])
+    return coordinates[:, 0], coordinates[:, 1]
+
+
+def sample_negatives(
+    candidate_hex_addresses, resolution, min_date, max_date, num_samples, rng
+):
+    import pandas as pd
+
+    latitudes, longitudes = sample_locations(
+        candidate_hex_addresses, resolution, num_samples, rng
+    )
+    return pd.DataFrame(
+        {
+            "date": sample_dates(min_date, max_date, num_samples, rng),
+            "latitude": latitudes,
+            "longitude": longitudes,
+        }
+    )
+
+
+# Per-process state for the worker pool, set once by the initializer so the
+# hexagon list isn't pickled with every chunk.
+_worker_args = None
+
+
+def _init_worker(*args):
+    global _worker_args
+    _worker_args = args
+
+
+def _sample_chunk(num_samples, seed_sequence):
+    import numpy as np
+
+    candidates, resolution, min_date, max_date = _worker_args
+    return sample_negatives(
+        candidates,
+        resolution,
+        min_date,
+        max_date,
+        num_samples,
+        np.random.default_rng(seed_sequence),
+    )
+
+
+def generate_chunks(
+    candidate_hex_addresses,
+    resolution,
+    min_date,
+    max_date,
+    num_samples,
+    chunk_size,
+    seed,
+    workers,
+):
+    """ Yields sample chunks in order. Each chunk has its own seed stream
+        spawned from seed, so the output only depends on seed and
+        chunk_size, never on the number of workers. At most two chunks per
+        worker are in flight at a time.
+    """
+    import numpy as np
+
+    from collections import deque
+    from multiprocessing import Pool
+
+    sizes = chunk_sizes(num_samples, chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    worker_args = (
+        list(candidate_hex_addresses),
+        resolution,
+        min_date,
+        max_date,
+    )
+
+    if workers == 1:
+        _init_worker(*worker_args)
+        for size, chunk_seed in zip(sizes, seeds):
+            yield _sample_chunk(size, chunk_seed)
+        return
+
+    with Pool(workers, _init_worker, worker_args) as pool:
+        pending = deque()
+        for size, chunk_seed in zip(sizes, seeds):
+            pending.append(pool.apply_async(_sample_chunk, (size, chunk_seed)))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
 
 
 @click.command()
@@ -42,14 +139,19 @@ def random_location(candidate_hex_addresses, resolution):
     default=datetime.today().date().strftime("%Y-%m-%d"),
 )
 @click.option(
-    "--hexagon-file", type=click.File("r"), default="data/us_hexagons.csv"
+    "--hexagon-file",
+    type=click.Path(exists=True),
+    default="data/us_hexagons.parquet",
 )
 @click.option("--location-resolution", type=int, default=11)
+@click.option("--seed", type=int, default=0)
+@click.option("--chunk-size", type=int, default=100000)
+@click.option("--workers", type=int, default=1)
 @click.option(
     "--output-file",
     "-o",
-    type=click.File("w"),
-    default="data/raw/synthesized_not_sightings.csv",
+    type=click.Path(),
+    default="data/raw/synthesized_not_sightings.parquet",
 )
 def main(
     num_samples,
@@ -57,27 +159,34 @@ def main(
     max_date,
     hexagon_file,
     location_resolution,
+    seed,
+    chunk_size,
+    workers,
     output_file,
 ):
-    min_date_obj = datetime.strptime(min_date, "%Y-%m-%d")
-    max_date_obj = datetime.strptime(max_date, "%Y-%m-%d")
-    hexagons = pd.read_csv(hexagon_file)
-    writer = csv.DictWriter(
-        output_file, fieldnames=["date", "latitude", "longitude"]
+    from tqdm import tqdm
+
+    hexagons = read_frame(hexagon_file, schema(["hex_address"]))
+    logger.info(
+        f"Sampling {num_samples} locations from {hexagons.shape[0]} "
+        f"hexagons with seed {seed} across {workers} workers."
     )
-    writer.writeheader()
-    for ii in tqdm(range(num_samples), total=num_samples):
-        latitude, longitude = random_location(
-            hexagons.hex_address, location_resolution
-        )
-        sample_date = random_date(min_date_obj, max_date_obj)
-        writer.writerow(
-            {
-                "date": sample_date.strftime("%Y-%m-%d"),
-                "latitude": latitude,
-                "longitude": longitude,
-            }
-        )
+    chunks = generate_chunks(
+        hexagons.hex_address,
+        location_resolution,
+        min_date,
+        max_date,
+        num_samples,
+        chunk_size,
+        seed,
+        workers,
+    )
+
+    logger.info(f"Writing samples to {output_file}.")
+    with FrameWriter(output_file, schema(SAMPLE_COLUMNS)) as writer:
+        num_chunks = len(chunk_sizes(num_samples, chunk_size))
+        for chunk in tqdm(chunks, total=num_chunks):
+            writer.write(chunk)
 
 
 if __name__ == "__main__":
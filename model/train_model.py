@@ -1,44 +1,42 @@
 import click
-import pandas as pd
-import mlflow
-
-
-from sklearn.model_selection import train_test_split
-from sklearn.pipeline import make_pipeline
-from sklearn.externals import joblib
-from sklearn.metrics import (
-    accuracy_score,
-    f1_score,
-    precision_score,
-    recall_score,
-    roc_auc_score,
-)
-from xgboost.sklearn import XGBClassifier
+import os
+
 from time import time
 from loguru import logger
-from yaspin import yaspin
-from toolz import get
 
-from assemble import RAW_FEATURES, TARGET
-from features import feature_pipeline, get_features
 
+def log_params(
+    max_depth, learning_rate, n_estimators, resolution, history_months=None
+):
+    import mlflow
 
-def log_params(max_depth, learning_rate, n_estimators, resolution):
     logger.info(f"Max depth: {max_depth}.")
     logger.info(f"Learning rate: {learning_rate}.")
     logger.info(f"Num estimators: {n_estimators}.")
     logger.info(f"Resolution: {resolution}.")
+    logger.info(f"History months: {history_months}.")
     mlflow.log_params(
         {
             "max_depth": str(max_depth),
             "learning_rate": str(learning_rate),
             "n_estimators": str(n_estimators),
             "resolution": str(resolution),
+            "history_months": str(history_months),
         }
     )
 
 
 def log_performance(model, test_x, test_y):
+    import mlflow
+
+    from sklearn.metrics import (
+        accuracy_score,
+        f1_score,
+        precision_score,
+        recall_score,
+        roc_auc_score,
+    )
+
     test_pred = model.predict(test_x)
     test_pred_proba = model.predict_proba(test_x)
 
@@ -62,9 +60,99 @@ def log_performance(model, test_x, test_y):
             "auc": auc,
         }
     )
+    return test_pred, test_pred_proba[:, 1]
+
+
+def log_evaluation(
+    test_y,
+    test_pred,
+    test_pred_proba,
+    num_resamples,
+    seed,
+    workers,
+    num_bins,
+    report_file,
+    calibration_plot_file,
+):
+    """ Bootstrap confidence intervals for the test metrics plus a
+        calibration curve, all logged to MLflow.
+    """
+    import json
+    import mlflow
+    import numpy as np
+
+    from evaluation import (
+        METRICS,
+        TestSet,
+        bootstrap,
+        calibration_curve,
+        confidence_intervals,
+        plot_calibration,
+    )
+
+    logger.info(f"Bootstrap seed: {seed}.")
+    mlflow.log_params(
+        {
+            "bootstrap_resamples": str(num_resamples),
+            "bootstrap_seed": str(seed),
+        }
+    )
+    test_set = TestSet(test_y, test_pred, test_pred_proba, num_bins)
+    point = test_set.metrics(np.ones((1, test_set.size)))
+    start = time()
+    resampled = bootstrap(test_set, num_resamples, seed=seed, workers=workers)
+    logger.info(
+        f"Scored {num_resamples} bootstrap resamples in "
+        f"{time() - start:.3f}s."
+    )
+    intervals = confidence_intervals(resampled)
+
+    metrics = {}
+    for metric in METRICS:
+        lower, upper = intervals[metric]
+        logger.info(
+            f"{metric}: {point[metric][0]:.4f} "
+            f"(95% CI {lower:.4f} - {upper:.4f})."
+        )
+        metrics[metric] = float(point[metric][0])
+        metrics[f"{metric}_ci_lower"] = float(lower)
+        metrics[f"{metric}_ci_upper"] = float(upper)
+    mlflow.log_metrics(
+        {
+            name: value
+            for name, value in metrics.items()
+            # The point estimates of the sklearn metrics are already logged.
+            if name.endswith("_ci_lower")
+            or name.endswith("_ci_upper")
+            or name in {"brier", "ece"}
+        }
+    )
+
+    curve = calibration_curve(test_set, point, intervals)
+    with open(report_file, "w") as f:
+        json.dump(
+            {
+                "num_resamples": num_resamples,
+                "seed": seed,
+                "confidence": 0.95,
+                "metrics": metrics,
+                "calibration": curve.to_dict(orient="records"),
+            },
+            f,
+            indent=2,
+        )
+    plot_calibration(curve, calibration_plot_file)
+    mlflow.log_artifact(report_file)
+    mlflow.log_artifact(calibration_plot_file)
 
 
 def log_feature_importances(model, importance_plot_file):
+    import mlflow
+    import pandas as pd
+
+    from toolz import get
+    from features import get_features
+
     final_features = get_features(model.steps[0][1])
     features = {f"f{ii}": feature for ii, feature in enumerate(final_features)}
     importances = (
@@ -91,13 +179,26 @@ def log_feature_importances(model, importance_plot_file):
     mlflow.log_artifact(importance_plot_file)
 
 
+def fit_pipeline(pipeline, x, y, profiler):
+    # Equivalent to pipeline.fit, split up so each step is timed separately.
+    features, classifier = pipeline.steps[0][1], pipeline.steps[-1][1]
+    with profiler.stage("feature_fit"):
+        features.fit(x, y)
+    with profiler.stage("feature_transform"):
+        transformed = features.transform(x)
+    with profiler.stage("booster_fit"):
+        classifier.fit(transformed, y)
+    return pipeline
+
+
 @click.command()
-@click.argument("raw_training_data", type=click.File("r"))
+@click.argument("raw_training_data", type=click.Path(exists=True))
 @click.option("--model-file", "-m", type=str, default="model/model.pkl")
+@click.option("--artifact-dir", type=str, default="model/artifact")
 @click.option(
     "--prediction-file",
     "-p",
-    type=click.File("w"),
+    type=click.Path(),
     default="data/processed/predictions.csv",
 )
 @click.option(
@@ -109,30 +210,105 @@ def log_feature_importances(model, importance_plot_file):
 @click.option("--learning-rate", type=float, default=0.15)
 @click.option("--n-estimators", type=int, default=500)
 @click.option("--resolution", "-r", type=int, default=3)
+@click.option(
+    "--history-months",
+    type=int,
+    default=None,
+    help="Add sightings in the same hexagon over this many prior months.",
+)
+@click.option(
+    "--bootstrap-resamples",
+    type=int,
+    default=0,
+    help="Bootstrap the test metrics this many times for confidence "
+    "intervals and a calibration curve.",
+)
+@click.option(
+    "--bootstrap-seed",
+    type=int,
+    default=0,
+    help="Seeds the resamples, which don't depend on the number of workers.",
+)
+@click.option("--bootstrap-workers", type=int, default=os.cpu_count())
+@click.option("--calibration-bins", type=int, default=10)
+@click.option(
+    "--evaluation-report-file",
+    type=str,
+    default="data/processed/evaluation.json",
+)
+@click.option(
+    "--calibration-plot-file",
+    type=str,
+    default="data/visualizations/calibration.png",
+)
+@click.option(
+    "--profile-report-file",
+    type=str,
+    default="data/processed/training_profile.json",
+)
+@click.option(
+    "--profile-dump-file",
+    type=str,
+    default=None,
+    help="Write cProfile stats for the slowest stage here.",
+)
 def main(
     raw_training_data,
     model_file,
+    artifact_dir,
     prediction_file,
     importance_plot_file,
     max_depth,
     learning_rate,
     n_estimators,
     resolution,
+    history_months,
+    bootstrap_resamples,
+    bootstrap_seed,
+    bootstrap_workers,
+    calibration_bins,
+    evaluation_report_file,
+    calibration_plot_file,
+    profile_report_file,
+    profile_dump_file,
 ):
-    training_data = pd.read_csv(raw_training_data)
+    # Heavy imports are deferred so --help and argument errors are instant.
+    import mlflow
+
+    from sklearn.model_selection import train_test_split
+    from sklearn.pipeline import make_pipeline
+    from sklearn.externals import joblib
+    from xgboost.sklearn import XGBClassifier
+    from yaspin import yaspin
+
+    from assemble import RAW_FEATURES, TARGET
+    from features import feature_pipeline
+    from artifact import export_artifact
+    from interchange import read_frame, write_frame
+    from profiling import StageProfiler
+
+    profiler = StageProfiler(profile=profile_dump_file is not None)
+
+    with profiler.stage("data_load"):
+        training_data = read_frame(raw_training_data)
 
     # Split the training and test set.
-    train_x, test_x, train_y, test_y = train_test_split(
-        training_data[RAW_FEATURES], training_data[TARGET], test_size=0.25
-    )
+    with profiler.stage("split"):
+        train_x, test_x, train_y, test_y = train_test_split(
+            training_data[RAW_FEATURES],
+            training_data[TARGET],
+            test_size=0.25,
+        )
 
     logger.info(f"Training set size: {train_x.shape[0]}.")
     logger.info(f"Test set size: {test_x.shape[0]}.")
-    log_params(max_depth, learning_rate, n_estimators, resolution)
+    log_params(
+        max_depth, learning_rate, n_estimators, resolution, history_months
+    )
 
     # Make the pipeline.
     pipeline = make_pipeline(
-        feature_pipeline(resolution),
+        feature_pipeline(resolution, history_months),
         XGBClassifier(
             max_depth=max_depth,
             learning_rate=learning_rate,
@@ -143,34 +319,77 @@ def main(
     logger.info("Fitting the pipeline.")
     start = time()
     with yaspin(text="👣 Training model 👣", color="cyan"):
-        pipeline.fit(train_x, train_y)
+        fit_pipeline(pipeline, train_x, train_y, profiler)
 
     logger.info(f"Model trained in {time() - start:.3f}s.")
-    log_performance(pipeline, test_x, test_y)
+    with profiler.stage("prediction"):
+        test_pred, test_pred_proba = log_performance(pipeline, test_x, test_y)
+
+    if bootstrap_resamples:
+        logger.info(f"Bootstrapping the test set {bootstrap_resamples} times.")
+        with profiler.stage("evaluation"):
+            log_evaluation(
+                test_y,
+                test_pred,
+                test_pred_proba,
+                bootstrap_resamples,
+                bootstrap_seed,
+                bootstrap_workers,
+                calibration_bins,
+                evaluation_report_file,
+                calibration_plot_file,
+            )
 
     logger.info(f"Training model with full dataset.")
     start = time()
     with yaspin(text="👣 Training model (full dataset) 👣", color="cyan"):
-        pipeline.fit(training_data[RAW_FEATURES], training_data[TARGET])
+        fit_pipeline(
+            pipeline,
+            training_data[RAW_FEATURES],
+            training_data[TARGET],
+            profiler,
+        )
+    logger.info(f"Model trained in {time() - start:.3f}s.")
 
     # Make the final predictions.
     logger.info("Making final predictions.")
-    predictions = pipeline.predict(training_data[RAW_FEATURES])
-    prediction_probas = pipeline.predict_proba(training_data[RAW_FEATURES])
+    with profiler.stage("prediction"):
+        predictions = pipeline.predict(training_data[RAW_FEATURES])
+        prediction_probas = pipeline.predict_proba(
+            training_data[RAW_FEATURES]
+        )
     training_data.loc[:, "sighting_predicted"] = predictions
     training_data.loc[:, "sighting_pred_proba"] = prediction_probas[:, 1]
 
     # Log the feature importances.
     logger.info(f"Saving feature importances to {importance_plot_file}.")
-    log_feature_importances(pipeline, importance_plot_file)
+    with profiler.stage("importance_plot"):
+        log_feature_importances(pipeline, importance_plot_file)
 
-    # Save the model pickle file.
-    logger.info(f"Saving pickled pipeline to {model_file}.")
-    joblib.dump(pipeline, model_file)
+    with profiler.stage("serialization"):
+        # Save the model pickle file.
+        logger.info(f"Saving pickled pipeline to {model_file}.")
+        joblib.dump(pipeline, model_file)
 
-    # Save the predictions to a csv.
-    logger.info(f"Saving final predictions to {prediction_file.name}.")
-    training_data.to_csv(prediction_file, index=False)
+        # Save the portable artifact for scoring without sklearn.
+        logger.info(f"Exporting portable model artifact to {artifact_dir}.")
+        export_artifact(pipeline, resolution, artifact_dir)
+
+        # Save the predictions to a csv.
+        logger.info(f"Saving final predictions to {prediction_file}.")
+        write_frame(training_data, prediction_file)
+
+    # Log where the time went.
+    logger.info(f"Saving training profile to {profile_report_file}.")
+    profiler.write_report(profile_report_file)
+    mlflow.log_metrics(profiler.metrics())
+    mlflow.log_artifact(profile_report_file)
+    if profile_dump_file is not None:
+        hottest = profiler.dump_hottest(profile_dump_file)
+        logger.info(
+            f"Saved cProfile stats for {hottest} to {profile_dump_file}."
+        )
+        mlflow.log_artifact(profile_dump_file)
 
 
 if __name__ == "__main__":
@@ -1,57 +1,39 @@
 import click
-import json
 import csv
 
-from toolz import get, second, compose, get_in
-
-listmap = compose(list, map)
-
-
-WEATHER_FIELDS = [
-    ("temperatureHigh", "temperature_high"),
-    ("temperatureLow", "temperature_low"),
-    ("dewPoint", "dew_point"),
-    ("humidity", "humidity"),
-    ("cloudCover", "cloud_cover"),
-    ("moonPhase", "moon_phase"),
-    ("precipIntensity", "precip_intensity"),
-    ("precipProbability", "precip_probability"),
-    ("precipType", "precip_type"),
-    ("pressure", "pressure"),
-    ("uvIndex", "uv_index"),
-    ("visibility", "visibility"),
-    ("windBearing", "wind_bearing"),
-    ("windSpeed", "wind_speed"),
-]
+from loguru import logger
+from interchange import write_frame
+from weather_store import WeatherColumns, WeatherStore
 
 
 @click.command()
 @click.option("--input-file", type=click.File("r"), default="-")
-@click.option("--output-file", type=click.File("w"), default="-")
-def main(input_file, output_file):
+@click.option(
+    "--output-file",
+    type=click.Path(),
+    default="data/interim/synthesized_not_sightings.parquet",
+)
+@click.option(
+    "--store-dir",
+    type=click.Path(),
+    default=None,
+    help="Also append the unpacked weather to this weather store.",
+)
+def main(input_file, output_file, store_dir):
     reader = csv.reader(input_file)
-    writer = csv.DictWriter(
-        output_file,
-        fieldnames=["date", "latitude", "longitude"]
-        + listmap(second, WEATHER_FIELDS),
-    )
-    writer.writeheader()
-
+    columns = WeatherColumns()
     for row in reader:
         date, latitude, longitude, _, payload = row
-        weather = get_in(["daily", "data", 0], json.loads(payload), {})
-        writer.writerow(
-            {
-                "date": date,
-                "latitude": latitude,
-                "longitude": longitude,
-                **{
-                    field_name: get(field, weather, None)
-                    for field, field_name in WEATHER_FIELDS
-                },
-            }
+        columns.append_payload(
+            date, float(latitude), float(longitude), payload
         )
 
+    weather = columns.to_frame()
+    if store_dir is not None:
+        logger.info(f"Appending {len(columns)} rows to {store_dir}.")
+        WeatherStore(store_dir).append(weather)
+    write_frame(weather, output_file)
+
 
 if __name__ == "__main__":
     main()
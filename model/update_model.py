@@ -0,0 +1,213 @@
+import click
+import os
+
+from time import time
+from loguru import logger
+
+
+def drift_reasons(
+    pipeline,
+    training_data,
+    new_data,
+    max_new_fraction,
+    max_unseen_hex_fraction,
+):
+    """ Returns why the new data is too different for an incremental update,
+        or an empty list if it's safe to keep boosting.
+    """
+    from assemble import TARGET
+    from features import get_geospatial_discretizer, get_one_hot_precip
+
+    reasons = []
+    feature_pipeline = pipeline.steps[0][1]
+
+    new_fraction = new_data.shape[0] / training_data.shape[0]
+    if new_fraction > max_new_fraction:
+        reasons.append(
+            f"new rows are {new_fraction:.1%} of the training data "
+            f"(max {max_new_fraction:.1%})"
+        )
+
+    # The one-hot encoder raises on categories it hasn't seen.
+    known_precip = set(get_one_hot_precip(feature_pipeline))
+    unseen_precip = (
+        set(new_data.precip_type.fillna("no_precipitation")) - known_precip
+    )
+    if unseen_precip:
+        reasons.append(f"unseen precip types {sorted(unseen_precip)}")
+
+    new_sightings = new_data[new_data[TARGET]]
+    if new_sightings.shape[0] > 0:
+        discretizer = get_geospatial_discretizer(feature_pipeline)
+        existing_counts = discretizer.transform(
+            new_sightings[["latitude", "longitude"]].values
+        )
+        unseen_hex_fraction = (existing_counts.values == 0).mean()
+        if unseen_hex_fraction > max_unseen_hex_fraction:
+            reasons.append(
+                f"{unseen_hex_fraction:.1%} of new sightings are in hexes "
+                f"without history (max {max_unseen_hex_fraction:.1%})"
+            )
+
+    return reasons
+
+
+def unseen_rows(new_data, existing_data):
+    """ The rows of new_data that aren't already in existing_data, so a
+        batch that's folded in twice only counts once.
+    """
+    merged = new_data.drop_duplicates().merge(
+        existing_data.drop_duplicates(), how="left", indicator=True
+    )
+    return (
+        merged[merged["_merge"] == "left_only"]
+        .drop(columns=["_merge"])
+        .reset_index(drop=True)
+    )
+
+
+def update_pipeline(pipeline, training_data, new_data, rounds):
+    """ Adds the new sightings to the discretizer counts in place, then
+        continues boosting from the existing booster for a bounded number of
+        rounds on the combined data.
+    """
+    from assemble import RAW_FEATURES, TARGET
+    from features import get_geospatial_discretizer, get_sighting_history
+
+    feature_pipeline = pipeline.steps[0][1]
+    classifier = pipeline.steps[-1][1]
+
+    get_geospatial_discretizer(feature_pipeline).partial_fit(
+        new_data[["latitude", "longitude"]], new_data[TARGET].values
+    )
+    history = get_sighting_history(feature_pipeline)
+    if history is not None:
+        history.partial_fit(
+            new_data[["date", "latitude", "longitude"]],
+            new_data[TARGET].values,
+        )
+
+    transformed = feature_pipeline.transform(training_data[RAW_FEATURES])
+    total_estimators = classifier.n_estimators
+    classifier.set_params(n_estimators=rounds)
+    classifier.fit(
+        transformed,
+        training_data[TARGET],
+        xgb_model=classifier.get_booster(),
+    )
+    classifier.set_params(n_estimators=total_estimators + rounds)
+    return pipeline
+
+
+@click.command()
+@click.argument("new_sightings", type=click.File("r"))
+@click.argument("new_not_sightings", type=click.Path(exists=True))
+@click.option(
+    "--training-data",
+    type=click.Path(exists=True),
+    default="data/processed/raw_training_data.parquet",
+)
+@click.option("--model-file", "-m", type=str, default="model/model.pkl")
+@click.option("--artifact-dir", type=str, default="model/artifact")
+@click.option(
+    "--rounds",
+    type=int,
+    default=25,
+    help="Boosting rounds to add on top of the existing booster.",
+)
+@click.option("--max-new-fraction", type=float, default=0.1)
+@click.option("--max-unseen-hex-fraction", type=float, default=0.5)
+@click.pass_context
+def main(
+    ctx,
+    new_sightings,
+    new_not_sightings,
+    training_data,
+    model_file,
+    artifact_dir,
+    rounds,
+    max_new_fraction,
+    max_unseen_hex_fraction,
+):
+    """ Folds new sightings (BFRO CSV with weather) and matching synthesized
+        negatives (typed weather file) into the existing model.
+    """
+    import pandas as pd
+
+    from sklearn.externals import joblib
+
+    from assemble import assemble
+    from features import get_geospatial_discretizer, get_sighting_history
+    from artifact import export_artifact
+    from interchange import read_frame, write_frame
+    from train_model import main as train_main
+
+    existing_data = read_frame(training_data)
+    batch = assemble(pd.read_csv(new_sightings), read_frame(new_not_sightings))
+    new_data = unseen_rows(batch, existing_data)
+    logger.info(
+        f"Read {batch.shape[0]} rows, {new_data.shape[0]} of them new "
+        f"({new_data.sighting.sum()} sightings)."
+    )
+    if new_data.shape[0] == 0:
+        logger.info("Nothing new to fold in.")
+        return
+
+    combined_data = pd.concat([existing_data, new_data]).reset_index(
+        drop=True
+    )
+    # The training data is only replaced once the model is saved, so a
+    # failed update can simply be rerun. Staged next to it for the rename.
+    root, extension = os.path.splitext(training_data)
+    staged_data = f"{root}.staged{extension}"
+
+    logger.info(f"Loading pipeline from {model_file}.")
+    pipeline = joblib.load(model_file)
+    resolution = get_geospatial_discretizer(pipeline.steps[0][1]).resolution
+    history = get_sighting_history(pipeline.steps[0][1])
+
+    reasons = drift_reasons(
+        pipeline,
+        existing_data,
+        new_data,
+        max_new_fraction,
+        max_unseen_hex_fraction,
+    )
+    if reasons:
+        for reason in reasons:
+            logger.warning(f"Drift guard: {reason}.")
+        logger.warning("Falling back to a full retrain.")
+        write_frame(combined_data, staged_data)
+        # Keep the existing model's hyperparameters, not train's defaults.
+        params = pipeline.steps[-1][1].get_params()
+        ctx.invoke(
+            train_main,
+            raw_training_data=staged_data,
+            model_file=model_file,
+            artifact_dir=artifact_dir,
+            max_depth=params["max_depth"],
+            learning_rate=params["learning_rate"],
+            n_estimators=params["n_estimators"],
+            resolution=resolution,
+            history_months=(
+                history.window_months if history is not None else None
+            ),
+        )
+    else:
+        logger.info(f"Boosting {rounds} more rounds.")
+        start = time()
+        update_pipeline(pipeline, combined_data, new_data, rounds)
+        logger.info(f"Model updated in {time() - start:.3f}s.")
+
+        logger.info(f"Saving pickled pipeline to {model_file}.")
+        joblib.dump(pipeline, model_file)
+        logger.info(f"Exporting portable model artifact to {artifact_dir}.")
+        export_artifact(pipeline, resolution, artifact_dir)
+        write_frame(combined_data, staged_data)
+
+    logger.info(f"Appending new rows to {training_data}.")
+    os.replace(staged_data, training_data)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,14 @@
 import click
-import json
-import pandas as pd
-import csv
+import os
 
-from h3 import h3
-from shapely.geometry import shape, mapping
-from tqdm import tqdm
 from loguru import logger
+from interchange import (
+    COMPACT_HEXAGON_COLUMNS,
+    HEXAGON_COLUMNS,
+    schema,
+    write_frame,
+)
+from polyfill import TILE_SIZE, cached_polyfill
 
 
 @click.command()
@@ -14,39 +16,72 @@ from loguru import logger
 @click.argument("data_file", type=click.File("r"))
 @click.option("--resolution", type=int, default=5)
 @click.option(
-    "--output-file", type=click.File("w"), default="data/us_hexagons.csv"
+    "--output-file", type=click.Path(), default="data/us_hexagons.parquet"
 )
-def main(polygon_file, data_file, resolution, output_file):
-    logger.info("Reading 👣 sightings.")
-    data = pd.read_csv(data_file).query("~latitude.isnull()")
-    data.loc[:, "h3_index"] = [
-        h3.geo_to_h3(row.latitude, row.longitude, resolution)
-        for _, row in data.iterrows()
-    ]
+@click.option("--workers", type=int, default=os.cpu_count())
+@click.option(
+    "--tile-size",
+    type=float,
+    default=TILE_SIZE,
+    help="Polygons wider than this many degrees are split into tiles.",
+)
+@click.option(
+    "--cache-dir", type=click.Path(), default="data/interim/polyfill_cache"
+)
+@click.option(
+    "--compact",
+    is_flag=True,
+    default=False,
+    help="Store mixed resolution parents without boundaries.",
+)
+def main(
+    polygon_file,
+    data_file,
+    resolution,
+    output_file,
+    workers,
+    tile_size,
+    cache_dir,
+    compact,
+):
+    import pandas as pd
+
+    from h3 import h3
+    from coverage import with_boundaries
 
-    logger.info("Reading US polygon.")
-    us_states = shape(json.load(polygon_file))
-    us_hexes = set(data.h3_index)
+    from sighting_index import cached_sighting_index
+
+    logger.info("Reading 👣 sightings.")
+    sighting_hexes = cached_sighting_index(data_file.name).hex_addresses(
+        resolution
+    )
 
     logger.info("Polyfilling the USA.")
-    for geometry in tqdm(us_states, total=len(us_states)):
-        us_hexes |= h3.polyfill(
-            mapping(geometry), resolution, geo_json_conformant=True
-        )
-    logger.info(f"Writing to {output_file.name}.")
-    writer = csv.DictWriter(
-        output_file, fieldnames=["hex_address", "hex_geojson"]
+    us_hexes = set(sighting_hexes) | cached_polyfill(
+        polygon_file.read(), resolution, workers, tile_size, cache_dir
     )
-    writer.writeheader()
-    for us_hex in tqdm(us_hexes, total=len(us_hexes)):
-        writer.writerow(
-            {
-                "hex_address": us_hex,
-                "hex_geojson": json.dumps(
-                    h3.h3_to_geo_boundary(us_hex, geo_json=True)
-                ),
-            }
+
+    if compact:
+        compacted = sorted(h3.compact(us_hexes))
+        logger.info(
+            f"Compacted {len(us_hexes)} hexagons to {len(compacted)} cells."
+        )
+        logger.info(f"Writing to {output_file}.")
+        write_frame(
+            pd.DataFrame(
+                {"hex_address": compacted, "coverage_resolution": resolution}
+            ),
+            output_file,
+            schema(COMPACT_HEXAGON_COLUMNS),
         )
+        return
+
+    logger.info(f"Writing to {output_file}.")
+    write_frame(
+        with_boundaries(pd.DataFrame({"hex_address": sorted(us_hexes)})),
+        output_file,
+        schema(HEXAGON_COLUMNS),
+    )
 
 
 if __name__ == "__main__":
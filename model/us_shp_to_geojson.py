@@ -1,20 +1,114 @@
-import geopandas as gpd
 import click
+import hashlib
 import json
+import os
 
-from shapely.geometry import mapping
+from loguru import logger
 
 
 NON_CONUS = {"VI", "AK", "HI", "PR", "GU", "MP", "AS"}
+SHAPEFILE_PARTS = [".shp", ".shx", ".dbf", ".prj"]
+KM_PER_DEGREE = 111.32
+
+
+def shapefile_hash(shapefile):
+    """ Hash of every part of the shapefile and the excluded states. """
+    digest = hashlib.sha256(",".join(sorted(NON_CONUS)).encode("utf-8"))
+    stem = os.path.splitext(shapefile)[0]
+    for extension in SHAPEFILE_PARTS:
+        part = stem + extension
+        if os.path.exists(part):
+            with open(part, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def cached_union(shapefile, cache_dir):
+    """ The union of the contiguous states, cached as WKB by a hash of the
+        shapefile. The union is the slow part and doesn't depend on the
+        resolution, so every resolution reuses it.
+    """
+    from shapely import wkb
+
+    cache_file = os.path.join(
+        cache_dir, f"union_{shapefile_hash(shapefile)[:16]}.wkb"
+    )
+    if os.path.exists(cache_file):
+        logger.info(f"Reusing cached union {cache_file}.")
+        with open(cache_file, "rb") as f:
+            return wkb.loads(f.read())
+
+    import geopandas as gpd
+
+    from shapely.ops import unary_union
+
+    us_states = gpd.read_file(shapefile).query("STUSPS not in @NON_CONUS")
+    logger.info(f"Dissolving {us_states.shape[0]} states.")
+    union = unary_union(us_states.geometry.values)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write then rename so a crash never leaves a partial cache file.
+    temporary = cache_file + ".tmp"
+    with open(temporary, "wb") as f:
+        f.write(wkb.dumps(union))
+    os.rename(temporary, cache_file)
+    return union
+
+
+def simplify_tolerance(resolution, edge_fraction):
+    """ Tolerance in degrees of edge_fraction of a hexagon edge. Polyfill
+        keeps cells by centroid, so moving the border by a small fraction of
+        an edge only changes cells whose centroids sit right on it.
+    """
+    from h3 import h3
+
+    edge_km = h3.edge_length(resolution, unit="km")
+    # Degrees of longitude are shorter than degrees of latitude, so this
+    # overestimates the distance and errs on the side of less simplifying.
+    return edge_fraction * edge_km / KM_PER_DEGREE
+
+
+def num_vertices(geometry):
+    if geometry.geom_type == "Polygon":
+        return len(geometry.exterior.coords) + sum(
+            len(ring.coords) for ring in geometry.interiors
+        )
+    return sum(num_vertices(part) for part in getattr(geometry, "geoms", []))
 
 
 @click.command()
 @click.argument("shapefile", type=str)
 @click.option("--output-file", type=click.File("w"), default="data/us.geojson")
-def main(shapefile, output_file):
-    us_states = gpd.read_file(shapefile).query("STUSPS not in @NON_CONUS")
+@click.option(
+    "--resolution",
+    type=int,
+    default=None,
+    help="Simplify for the finest H3 resolution the outline is used at.",
+)
+@click.option(
+    "--edge-fraction",
+    type=float,
+    default=0.1,
+    help="Simplification tolerance as a fraction of a hexagon edge.",
+)
+@click.option(
+    "--cache-dir", type=click.Path(), default="data/interim/union_cache"
+)
+def main(shapefile, output_file, resolution, edge_fraction, cache_dir):
+    from shapely.geometry import mapping
+
+    polygon = cached_union(shapefile, cache_dir)
 
-    polygon = us_states.geometry.cascaded_union
+    if resolution is not None:
+        tolerance = simplify_tolerance(resolution, edge_fraction)
+        vertices = num_vertices(polygon)
+        # Preserving topology keeps rings valid and holes inside shells.
+        polygon = polygon.simplify(tolerance, preserve_topology=True)
+        logger.info(
+            f"Simplified with a {tolerance:.4f} degree tolerance for "
+            f"resolution {resolution}, {vertices} -> "
+            f"{num_vertices(polygon)} vertices."
+        )
 
     json.dump(mapping(polygon), output_file)
 
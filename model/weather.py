@@ -1,39 +1,42 @@
 import click
 import os
-import pandas as pd
 import csv
 
 from dotenv import load_dotenv, find_dotenv
+from interchange import SAMPLE_COLUMNS, read_frame, schema
 
 load_dotenv(find_dotenv())
 
 DARK_SKY_KEY = os.getenv("DARK_SKY_KEY")
+# Overridable so the fetchers can be pointed at a local stand-in.
+DARK_SKY_URL = os.getenv("DARK_SKY_URL", "https://api.darksky.net")
 
 
-def create_weather_request(lat, lon, time, key=None):
-    return "https://api.darksky.net/forecast/{}/{},{},{}?exclude={}".format(
-        key, lat, lon, time, "currently,hourly,minutely"
+def create_weather_request(lat, lon, time, key=None, base_url=DARK_SKY_URL):
+    return "{}/forecast/{}/{},{},{}?exclude={}".format(
+        base_url, key, lat, lon, time, "currently,hourly,minutely"
     )
 
 
 @click.command()
-@click.argument("data_file", type=click.File("r"))
+@click.argument("data_file", type=click.Path(exists=True))
 @click.option("--output-file", "-o", type=click.File("w"), default="-")
 def main(data_file, output_file):
-
-    data = pd.read_csv(data_file).query("~latitude.isnull()")
+    data = read_frame(data_file, schema(SAMPLE_COLUMNS)).query(
+        "~latitude.isnull()"
+    )
     writer = csv.writer(output_file)
-    for _, r in data[["date", "latitude", "longitude"]].iterrows():
-
+    for _, r in data.iterrows():
+        date = r.date.strftime("%Y-%m-%d")
         writer.writerow(
             [
-                r.date,
+                date,
                 r.latitude,
                 r.longitude,
                 create_weather_request(
                     r.latitude,
                     r.longitude,
-                    str(r.date) + "T00:00:00",
+                    date + "T00:00:00",
                     key=DARK_SKY_KEY,
                 ),
             ]
@@ -0,0 +1,159 @@
+import os
+import uuid
+
+try:
+    # orjson is several times faster on the Dark Sky payloads.
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+from interchange import SAMPLE_COLUMNS, COLUMN_TYPES, schema
+
+
+WEATHER_FIELDS = [
+    ("temperatureHigh", "temperature_high"),
+    ("temperatureLow", "temperature_low"),
+    ("dewPoint", "dew_point"),
+    ("humidity", "humidity"),
+    ("cloudCover", "cloud_cover"),
+    ("moonPhase", "moon_phase"),
+    ("precipIntensity", "precip_intensity"),
+    ("precipProbability", "precip_probability"),
+    ("precipType", "precip_type"),
+    ("pressure", "pressure"),
+    ("uvIndex", "uv_index"),
+    ("visibility", "visibility"),
+    ("windBearing", "wind_bearing"),
+    ("windSpeed", "wind_speed"),
+]
+
+WEATHER_COLUMNS = SAMPLE_COLUMNS + [name for _, name in WEATHER_FIELDS]
+KEY_COLUMNS = SAMPLE_COLUMNS
+
+
+class WeatherColumns:
+    """ Typed column buffers for unpacked Dark Sky daily conditions. Rows go
+        straight into per-column lists and come out as numpy arrays, with no
+        intermediate dict per row.
+    """
+
+    def __init__(self):
+        self.columns = {column: [] for column in WEATHER_COLUMNS}
+
+    def __len__(self):
+        return len(self.columns["date"])
+
+    def append(self, date, latitude, longitude, conditions):
+        self.columns["date"].append(date)
+        self.columns["latitude"].append(latitude)
+        self.columns["longitude"].append(longitude)
+        for field, name in WEATHER_FIELDS:
+            self.columns[name].append(conditions.get(field))
+
+    def append_payload(self, date, latitude, longitude, payload):
+        """ Adds the first day of a historical (time machine) payload. """
+        daily = loads(payload).get("daily", {}).get("data", [])
+        self.append(date, latitude, longitude, daily[0] if daily else {})
+
+    def append_forecast(self, payload):
+        """ Adds every day of a forecast payload, dated by its timestamp. """
+        import numpy as np
+
+        weather = loads(payload) if isinstance(payload, str) else payload
+        latitude = weather.get("latitude", np.nan)
+        longitude = weather.get("longitude", np.nan)
+        for conditions in weather.get("daily", {}).get("data", []):
+            self.append(
+                np.datetime64(int(conditions["time"]), "s"),
+                latitude,
+                longitude,
+                conditions,
+            )
+
+    def to_frame(self):
+        import numpy as np
+        import pandas as pd
+
+        arrays = {}
+        for column in WEATHER_COLUMNS:
+            dtype = COLUMN_TYPES[column]
+            values = self.columns[column]
+            if dtype == "float64":
+                # None becomes NaN.
+                arrays[column] = np.array(values, dtype=float)
+            elif column == "date":
+                arrays[column] = np.array(values, dtype="datetime64[D]")
+            else:
+                arrays[column] = np.array(values, dtype=object)
+        return pd.DataFrame(arrays, columns=WEATHER_COLUMNS).astype(
+            dict(schema(WEATHER_COLUMNS))
+        )
+
+
+class WeatherStore:
+    """ Append-only Parquet dataset of typed weather, one part file per
+        batch, with lookups by (date, latitude, longitude).
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self._frame = None
+        os.makedirs(store_dir, exist_ok=True)
+
+    def part_files(self):
+        return sorted(
+            os.path.join(self.store_dir, name)
+            for name in os.listdir(self.store_dir)
+            if name.endswith(".parquet")
+        )
+
+    def append(self, columns):
+        """ Writes a WeatherColumns (or weather frame) batch as a new part.
+        """
+        frame = columns.to_frame() if hasattr(columns, "to_frame") else columns
+        if frame.shape[0] == 0:
+            return
+        name = f"part-{len(self.part_files()):05d}-{uuid.uuid4().hex[:8]}"
+        # Write then rename so readers never see a partial part file.
+        temporary = os.path.join(self.store_dir, f".{name}.tmp")
+        frame.to_parquet(temporary, index=False)
+        os.rename(temporary, os.path.join(self.store_dir, f"{name}.parquet"))
+        self._frame = None
+
+    def read(self):
+        """ All stored weather, latest write winning for repeated keys,
+            indexed by (date, latitude, longitude).
+        """
+        import pandas as pd
+
+        if self._frame is None:
+            parts = self.part_files()
+            frame = (
+                pd.concat([pd.read_parquet(part) for part in parts])
+                if parts
+                else pd.DataFrame(columns=WEATHER_COLUMNS)
+            )
+            self._frame = (
+                frame.astype(dict(schema(WEATHER_COLUMNS)))
+                .drop_duplicates(subset=KEY_COLUMNS, keep="last")
+                .set_index(KEY_COLUMNS)
+                .sort_index()
+            )
+        return self._frame
+
+    def keys(self):
+        return set(self.read().index)
+
+    def get(self, date, latitude, longitude):
+        import pandas as pd
+
+        return self.read().loc[(pd.Timestamp(date), latitude, longitude)]
+
+    def lookup(self, samples):
+        """ Weather for each (date, latitude, longitude) row of samples, in
+            the same order, with NaNs where nothing is stored yet.
+        """
+        import pandas as pd
+
+        index = pd.MultiIndex.from_frame(samples[KEY_COLUMNS])
+        return self.read().reindex(index).reset_index()
@@ -7,6 +7,7 @@ import os
 import json
 
 from dotenv import load_dotenv, find_dotenv
+from functools import lru_cache
 from palettable.colorbrewer.sequential import YlOrRd_9 as colors
 from math import floor
 from datetime import datetime
@@ -21,9 +22,10 @@ def make_layers(data):
     # We want one layer per color group.
     for color, group in data.groupby("color"):
         # Each layer is a multipolygon of all hexagons with the same color.
-        geojson = {"type": "MultiPolygon", "coordinates": []}
-        for _, row in group.iterrows():
-            geojson["coordinates"].append([json.loads(row.hex_geojson)])
+        geojson = {
+            "type": "MultiPolygon",
+            "coordinates": [[boundary] for boundary in group.boundary],
+        }
         layers.append(
             {
                 "sourcetype": "geojson",
@@ -146,28 +148,79 @@ app = dash.Dash(
 
 app.title = "SquatchCast"
 
-data = pd.read_csv("squatchcast.csv").assign(
-    color=lambda frame: frame.squatchcast.apply(
-        lambda x: colors.hex_colors[
-            (floor(x * 10) - 1) if floor(x * 10) > 0 else 0
+HEXAGON_FILE = os.getenv(
+    "SQUATCHCAST_HEXAGONS", "data/squatchcast/hexagons.parquet"
+)
+FORECAST_FILE = os.getenv(
+    "SQUATCHCAST_FORECAST", "data/squatchcast/forecast.parquet"
+)
+
+# The hexagons are read once; each day's forecast is joined to them only
+# when that day is first shown.
+# The boundaries are parsed once here rather than for every day's layers.
+hexagons = (
+    pd.read_parquet(HEXAGON_FILE)
+    .set_index("hex_address")
+    .assign(
+        boundary=lambda frame: [
+            json.loads(boundary) for boundary in frame.hex_geojson
         ]
-    ),
-    text=lambda frame: frame.squatchcast.apply(
-        lambda x: f"Squatchcast: {x:.3f}"
-    ),
-    precip_type=lambda frame: np.where(
-        frame.precip_probability < 0.4, "no_precipitation", frame.precip_type
-    ),
+    )
+    .drop(columns=["hex_geojson"])
+)
+forecast = pd.read_parquet(FORECAST_FILE).assign(
+    date=lambda frame: frame.date.dt.strftime("%Y-%m-%d")
 )
 
-dates = {ii: d for ii, d in enumerate(sorted(data.date.unique()))}
+dates = {ii: d for ii, d in enumerate(sorted(forecast.date.unique()))}
 date_marks = {
     ii: datetime.strptime(d, "%Y-%m-%d").strftime("%m/%d")
     for ii, d in dates.items()
 }
-layers = {
-    ii: make_layers(data.query(f"date=='{dates[ii]}'")) for ii in dates.keys()
-}
+
+
+@lru_cache(maxsize=None)
+def day_data(day):
+    """ Every hexagon with its forecast for one day. Hexagons whose forecast
+        failed are kept with zeros, as in the old denormalized file.
+    """
+    date = dates[day]  # noqa
+    day_forecast = (
+        forecast.query("date==@date")
+        .drop(columns=["date"])
+        .set_index("hex_address")
+    )
+    return (
+        hexagons.join(day_forecast, how="left")
+        .fillna(
+            {
+                "squatchcast": 0.0,
+                "temperature_high": 0.0,
+                "precip_probability": 0.0,
+            }
+        )
+        .assign(
+            color=lambda frame: frame.squatchcast.apply(
+                lambda x: colors.hex_colors[
+                    (floor(x * 10) - 1) if floor(x * 10) > 0 else 0
+                ]
+            ),
+            text=lambda frame: frame.squatchcast.apply(
+                lambda x: f"Squatchcast: {x:.3f}"
+            ),
+            precip_type=lambda frame: np.where(
+                frame.precip_probability < 0.4,
+                "no_precipitation",
+                frame.precip_type,
+            ),
+        )
+    )
+
+
+@lru_cache(maxsize=None)
+def day_layers(day):
+    return make_layers(day_data(day))
+
 
 ###############################################################################
 # LAYOUT
@@ -267,34 +320,26 @@ app.layout = html.Div(
     Output("squatchcast-map", "figure"), [Input("day-slider", "value")]
 )
 def update_map(day):
-    date = dates[day]  # noqa
-    return squatchcast_map(data.query(f"date==@date"), layers[day])
+    return squatchcast_map(day_data(day), day_layers(day))
 
 
 @app.callback(
     Output("squatchcast-hist", "figure"), [Input("day-slider", "value")]
 )
 def update_score_hist(day):
-    date = dates[day]  # noqa
-    return squatchcast_score_distribution(
-        data.query("date==@date"), date_marks[day]
-    )
+    return squatchcast_score_distribution(day_data(day), date_marks[day])
 
 
 @app.callback(
     Output("temperature-hist", "figure"), [Input("day-slider", "value")]
 )
 def update_temperature_hist(day):
-    date = dates[day]  # noqa
-    return squatchcast_temp_distribution(
-        data.query("date==@date"), date_marks[day]
-    )
+    return squatchcast_temp_distribution(day_data(day), date_marks[day])
 
 
 @app.callback(Output("precip-bar", "figure"), [Input("day-slider", "value")])
 def update_precip_bar(day):
-    date = dates[day]  # noqa
-    return squatchcast_precip(data.query("date==@date"), date_marks[day])
+    return squatchcast_precip(day_data(day), date_marks[day])
 
 
 @app.callback(
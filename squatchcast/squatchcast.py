@@ -1,199 +1,208 @@
 import click
 import os
-import pandas as pd
-import numpy as np
-import requests
 import sys
 
 from dotenv import load_dotenv, find_dotenv
 from loguru import logger
-from h3 import h3
-from tqdm import tqdm
-from toolz import get, get_in, curry
-from datetime import datetime
-from sklearn.externals.joblib import load
-from yaspin import yaspin
 
 
 load_dotenv(find_dotenv())
 sys.path.append("./model")
 
-from assemble import RAW_FEATURES  # noqa
-
 
 DARK_SKY_KEY = os.getenv("DARK_SKY_KEY")
+DARK_SKY_URL = os.getenv("DARK_SKY_URL", "https://api.darksky.net")
+
+
+def create_weather_request(lat, lon, key, base_url=DARK_SKY_URL):
+    return f"{base_url}/forecast/{key}/{lat},{lon}?exclude=hourly,minutely"
 
-if not DARK_SKY_KEY:
-    logger.error("No Dark Sky key was found. Double check .env file.")
-    sys.exit(1)
 
+def fetch_forecasts(
+    session, latitudes, longitudes, key, base_url=DARK_SKY_URL, stats=None
+):
+    """ Fetches the forecast for each location in turn. Returns the response
+        bodies and the number of failed requests. stats, when given, is a
+        FetchStats that records each request's latency and status.
+    """
+    import requests
 
-def create_weather_request(lat, lon, key):
-    return (
-        "https://api.darksky.net/forecast/"
-        f"{key}/{lat},{lon}?exclude=hourly,minutely"
+    from time import perf_counter
+    from tqdm import tqdm
+
+    weather_conditions = []
+    failed = 0
+    progress = tqdm(
+        zip(latitudes, longitudes),
+        total=len(latitudes),
+        disable=stats is not None,
     )
+    for lat, lon in progress:
+        request = create_weather_request(lat, lon, key, base_url)
+        start = perf_counter()
+        try:
+            weather_response = session.get(request)
+            if stats is not None:
+                stats.record_status(weather_response.status_code)
+            # Make sure the response worked.
+            weather_response.raise_for_status()
+            # Now parse the json.
+            weather_conditions.append(weather_response.text)
+        except requests.HTTPError:
+            failed += 1
+        finally:
+            if stats is not None:
+                stats.latencies.append(perf_counter() - start)
+    if stats is not None:
+        stats.succeeded += len(weather_conditions)
+        stats.failed += failed
+    return weather_conditions, failed
 
 
 @click.command()
 @click.option(
-    "--us-hexagons", type=click.File("r"), default="data/raw/us_hexagons.csv"
+    "--us-hexagons",
+    type=click.Path(exists=True),
+    default="data/raw/us_hexagons.parquet",
 )
 @click.option(
     "--historical-sightings",
     type=click.File("r"),
     default="data/raw/bigfoot_sightings.csv",
 )
-@click.option("--model-file", type=str, default="model/model.pkl")
+@click.option("--model-artifact", type=str, default="model/artifact")
 @click.option("--debug", is_flag=True, default=False)
-@click.option("--output-file", type=click.File("w"), default="squatchcast.csv")
-def main(us_hexagons, historical_sightings, model_file, debug, output_file):
+@click.option(
+    "--hexagon-file",
+    type=click.Path(),
+    default="data/squatchcast/hexagons.parquet",
+    help="Static table of hexagon geometry, centroid and sightings.",
+)
+@click.option(
+    "--forecast-file",
+    type=click.Path(),
+    default="data/squatchcast/forecast.parquet",
+    help="Per day scores and weather keyed by hex_address.",
+)
+@click.option("--base-url", type=str, default=DARK_SKY_URL)
+def main(
+    us_hexagons,
+    historical_sightings,
+    model_artifact,
+    debug,
+    hexagon_file,
+    forecast_file,
+    base_url,
+):
+    if not DARK_SKY_KEY:
+        logger.error("No Dark Sky key was found. Double check .env file.")
+        sys.exit(1)
+
+    # Heavy imports are deferred so --help and argument errors are instant.
+    import requests
+
+    from h3 import h3
+    from tqdm import tqdm
+    from yaspin import yaspin
+
+    from artifact import load_artifact
+    from coverage import load_coverage
+    from interchange import (
+        SQUATCHCAST_FORECAST_COLUMNS,
+        SQUATCHCAST_HEXAGON_COLUMNS,
+        schema,
+        write_frame,
+    )
+    from sighting_index import cached_sighting_index
+    from weather_store import WeatherColumns
 
-    logger.info(f"Reading hexagons from {us_hexagons.name}.")
-    squatchcast_locations = pd.read_csv(us_hexagons)
+    logger.info(f"Reading hexagons from {us_hexagons}.")
+    squatchcast_locations = load_coverage(us_hexagons, boundaries=True)
     logger.info(f"Read {squatchcast_locations.shape[0]} hexagons.")
 
     logger.info(
         f"Reading historical sightings from {historical_sightings.name}."
     )
-    historical_sightings_frame = pd.read_csv(historical_sightings).query(
-        "~latitude.isnull()"
-    )
-    logger.info(
-        f"Read {historical_sightings_frame.shape[0]} historical_sightings."
-    )
+    # Shared with the other sighting consumers and cached per file.
+    sighting_index = cached_sighting_index(historical_sightings.name)
 
     if debug:
         logger.warning("Debug selected, pulling top five records.")
         squatchcast_locations = squatchcast_locations.head()
 
     num_locations = squatchcast_locations.shape[0]
-    lats = []
-    lons = []
     logger.info("Extracting hexagon lat / lon values.")
-    for _, row in tqdm(squatchcast_locations.iterrows(), total=num_locations):
-        lat, lon = h3.h3_to_geo(row.hex_address)
-        lats.append(lat)
-        lons.append(lon)
-
-    squatchcast_locations.loc[:, "latitude"] = lats
-    squatchcast_locations.loc[:, "longitude"] = lons
+    centroids = [
+        h3.h3_to_geo(hex_address)
+        for hex_address in squatchcast_locations.hex_address
+    ]
+    squatchcast_locations = squatchcast_locations.assign(
+        latitude=[lat for lat, _ in centroids],
+        longitude=[lon for _, lon in centroids],
+    )
 
     session = requests.Session()
     logger.info(f"Retrieving the weather for {num_locations} " "locations.")
-    weather_conditions = []
-    failed = 0
-    for _, row in tqdm(squatchcast_locations.iterrows(), total=num_locations):
-        request = create_weather_request(
-            row.latitude, row.longitude, DARK_SKY_KEY
-        )
-        try:
-            weather_response = session.get(request)
-            # Make sure the response worked.
-            weather_response.raise_for_status()
-            # Now parse the json.
-            weather_conditions.append(weather_response.json())
-        except requests.HTTPError:
-            failed += 1
+    weather_conditions, failed = fetch_forecasts(
+        session,
+        squatchcast_locations.latitude.values,
+        squatchcast_locations.longitude.values,
+        DARK_SKY_KEY,
+        base_url,
+    )
     logger.info(f"{failed} requests to Dark Sky failed.")
 
-    # Extract the features a list of dicts. Plan is to turn that into a
-    # data frame and concatenate them to the squatchcast_locations.
+    # Unpack every forecast day straight into typed weather columns.
     logger.info("Unpacking weather results.")
-    squatchcast_features = []
+    forecast_columns = WeatherColumns()
     for weather in tqdm(weather_conditions, total=num_locations):
-        # Append the current features.
-        daily = get_in(["daily", "data"], weather, [])
-        latitude = get("latitude", weather, np.nan)
-        longitude = get("longitude", weather, np.nan)
-        for conditions in daily:
-            get_condition = curry(get)(seq=conditions, default=np.nan)
-            squatchcast_features.append(
-                {
-                    "date": datetime.utcfromtimestamp(
-                        get_condition("time")
-                    ).strftime("%Y-%m-%d"),
-                    "latitude": latitude,
-                    "longitude": longitude,
-                    "precip_type": get(
-                        "precipType", conditions, "no_precipitation"
-                    ),
-                    "temperature_high": get_condition("temperatureHigh"),
-                    "temperature_low": get_condition("temperatureLow"),
-                    "dew_point": get_condition("dewPoint"),
-                    "humidity": get_condition("humidity"),
-                    "cloud_cover": get_condition("cloudCover"),
-                    "moon_phase": get_condition("moonPhase"),
-                    "precip_intensity": get_condition("precipIntensity"),
-                    "precip_probability": get_condition("precipProbability"),
-                    "pressure": get_condition("pressure"),
-                    "uv_index": get_condition("uvIndex"),
-                    "visibility": get_condition("visibility"),
-                    "wind_bearing": get_condition("windBearing"),
-                    "wind_speed": get_condition("windSpeed"),
-                }
-            )
-
-    squatchcast_frame = pd.DataFrame.from_records(squatchcast_features)
-    logger.info(f"Loading model from {model_file}.")
-    model = load(model_file)
+        forecast_columns.append_forecast(weather)
+
+    squatchcast_frame = forecast_columns.to_frame().assign(
+        precip_type=lambda x: x.precip_type.fillna("no_precipitation")
+    )
+
+    logger.info(f"Loading model artifact from {model_artifact}.")
+    model = load_artifact(model_artifact)
     logger.info(
         f"Getting predictions for {squatchcast_frame.shape[0]} locations."
     )
     with yaspin(text="👣 Calculating squatchcast. 👣", color="cyan"):
         squatchcast_frame.loc[:, "squatchcast"] = model.predict_proba(
-            squatchcast_frame[RAW_FEATURES]
+            squatchcast_frame
         )[:, 1]
     # Get the resoluton the US hexagon file is at and index the squatchcast
     # results by that resolution.
     us_resolution = h3.h3_get_resolution(
-        squatchcast_locations.head(1).hex_address[0]
+        squatchcast_locations.hex_address.iloc[0]
     )
+    squatchcast_frame.loc[:, "hex_address"] = [
+        h3.geo_to_h3(lat, lon, us_resolution)
+        for lat, lon in zip(
+            squatchcast_frame.latitude, squatchcast_frame.longitude
+        )
+    ]
 
-    squatchcast_frame.loc[:, "hex_address"] = np.apply_along_axis(
-        lambda x: h3.geo_to_h3(x[0], x[1], us_resolution),
-        axis=1,
-        arr=squatchcast_frame[["latitude", "longitude"]].values,
+    # The hexagons don't change from day to day, so they're stored once and
+    # the daily forecast only carries their address.
+    historical_sightings_agg = sighting_index.to_frame(us_resolution).rename(
+        columns={"count": "historical_sightings"}
     )
+    hexagons = squatchcast_locations.merge(
+        historical_sightings_agg, on="hex_address", how="left"
+    ).fillna({"historical_sightings": 0})
 
-    historical_sightings_frame.loc[:, "hex_address"] = np.apply_along_axis(
-        lambda x: h3.geo_to_h3(x[0], x[1], us_resolution),
-        axis=1,
-        arr=historical_sightings_frame[["latitude", "longitude"]].values,
+    logger.info(
+        f"Writing {hexagons.shape[0]} hexagons to {hexagon_file} and "
+        f"{squatchcast_frame.shape[0]} forecasts to {forecast_file}."
     )
-
-    historical_sightings_agg = (
-        historical_sightings_frame.groupby("hex_address")
-        .agg({"number": "count"})
-        .reset_index()
+    write_frame(hexagons, hexagon_file, schema(SQUATCHCAST_HEXAGON_COLUMNS))
+    write_frame(
+        squatchcast_frame.sort_values(["date", "hex_address"]),
+        forecast_file,
+        schema(SQUATCHCAST_FORECAST_COLUMNS),
     )
 
-    # Now we need, for each day, a complete hexagonification of the US. We'll
-    # do this in a groupby and concatenate.
-    visualization_frames = []
-    for date, frame in squatchcast_frame.groupby("date"):
-        # Merge weather and US hexagons.
-        weather_location_merge = pd.merge(
-            squatchcast_locations.drop(columns=["latitude", "longitude"]),
-            frame,
-            on="hex_address",
-            how="left",
-        )
-        # Merge historical sightings.
-        visualization_frames.append(
-            pd.merge(
-                weather_location_merge,
-                historical_sightings_agg,
-                on="hex_address",
-                how="left",
-            )
-            .fillna(0)
-            .astype({"number": "int"})
-            .rename(columns={"number": "historical_sightings"})
-        )
-
-    pd.concat(visualization_frames).to_csv(output_file, index=False)
-
 
 if __name__ == "__main__":
     main()
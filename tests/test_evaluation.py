@@ -0,0 +1,64 @@
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append("./model")
+
+import evaluation  # noqa: E402
+
+
+def random_test_set(rng, size=300):
+    y = rng.random(size) < 0.4
+    # Rounded so some scores tie, which AUC has to count half.
+    probability = np.round(
+        np.clip(0.3 * y + rng.random(size) * 0.7, 0, 1), 2
+    )
+    return evaluation.TestSet(y, probability > 0.5, probability)
+
+
+def test_metrics_of_ones_match_sklearn():
+    from sklearn.metrics import (
+        accuracy_score,
+        brier_score_loss,
+        f1_score,
+        precision_score,
+        recall_score,
+        roc_auc_score,
+    )
+
+    test_set = random_test_set(np.random.default_rng(0))
+
+    metrics = test_set.metrics(np.ones((1, test_set.size)))
+
+    y, prediction = test_set.y, test_set.prediction
+    expected = {
+        "accuracy": accuracy_score(y, prediction),
+        "f1": f1_score(y, prediction),
+        "precision": precision_score(y, prediction),
+        "recall": recall_score(y, prediction),
+        "auc": roc_auc_score(y, test_set.probability),
+        "brier": brier_score_loss(y, test_set.probability),
+    }
+    for name, value in expected.items():
+        assert metrics[name][0] == pytest.approx(value), name
+
+
+def test_resampled_metrics_match_weighted_sklearn():
+    from sklearn.metrics import f1_score, roc_auc_score
+
+    rng = np.random.default_rng(1)
+    test_set = random_test_set(rng)
+    weights = test_set.resample_weights(5, rng).astype(float)
+
+    metrics = test_set.metrics(weights)
+
+    for row, counts in enumerate(weights):
+        assert metrics["auc"][row] == pytest.approx(
+            roc_auc_score(
+                test_set.y, test_set.probability, sample_weight=counts
+            )
+        )
+        assert metrics["f1"][row] == pytest.approx(
+            f1_score(test_set.y, test_set.prediction, sample_weight=counts)
+        )
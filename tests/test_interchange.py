@@ -0,0 +1,41 @@
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append("./model")
+
+from interchange import read_frame, schema, write_frame  # noqa: E402
+
+
+WEATHER_COLUMNS = ["date", "latitude", "longitude", "precip_type"]
+
+
+@pytest.mark.parametrize("extension", ["parquet", "feather", "csv"])
+@pytest.mark.parametrize("use_schema", [False, True])
+def test_null_precip_type_round_trips_as_nan(tmp_path, extension, use_schema):
+    from sklearn.impute import SimpleImputer
+
+    # Weather frames are built from None for days without precipitation.
+    frame = pd.DataFrame(
+        {
+            "date": pd.to_datetime(["2019-06-01", "2019-06-02"]),
+            "latitude": [45.0, 46.0],
+            "longitude": [-122.0, -121.0],
+            "precip_type": np.array(["rain", None], dtype=object),
+        }
+    )
+    path = str(tmp_path / f"weather.{extension}")
+    frame_schema = schema(WEATHER_COLUMNS) if use_schema else None
+
+    write_frame(frame, path, frame_schema)
+    precip_type = read_frame(path, frame_schema)["precip_type"]
+
+    assert precip_type.iloc[0] == "rain"
+    assert precip_type.iloc[1] is not None
+    assert pd.isnull(precip_type.iloc[1])
+    filled = SimpleImputer(
+        strategy="constant", fill_value="no_precipitation"
+    ).fit_transform(precip_type.to_frame().astype(object))
+    assert list(filled[:, 0]) == ["rain", "no_precipitation"]
@@ -0,0 +1,41 @@
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append("./model")
+
+from assemble import RAW_FEATURES  # noqa: E402
+from score_server import rows_to_columns  # noqa: E402
+
+
+ROW = {"date": "2019-06-01", "latitude": 45.5, "longitude": -122.6}
+
+
+def test_missing_weather_becomes_nan():
+    columns = rows_to_columns([dict(ROW, humidity=0.4)], RAW_FEATURES)
+
+    assert columns["date"][0] == np.datetime64("2019-06-01")
+    assert columns["humidity"][0] == 0.4
+    assert np.isnan(columns["temperature_high"][0])
+    assert columns["precip_type"][0] is None
+
+
+@pytest.mark.parametrize(
+    "row",
+    [
+        {"latitude": 45.5, "longitude": -122.6},
+        dict(ROW, latitude=None),
+        dict(ROW, date=20190601),
+        dict(ROW, date="June 1st"),
+        dict(ROW, latitude=91),
+        dict(ROW, longitude=-180.5),
+        dict(ROW, latitude=True),
+        dict(ROW, longitude="-122.6"),
+        dict(ROW, precip_type=1),
+        dict(ROW, humidity="high"),
+    ],
+)
+def test_unscorable_rows_are_rejected(row):
+    with pytest.raises(ValueError):
+        rows_to_columns([ROW, row], RAW_FEATURES)
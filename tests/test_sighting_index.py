@@ -0,0 +1,91 @@
+import sys
+
+import numpy as np
+
+sys.path.append("./model")
+
+from h3_int import to_int  # noqa: E402
+from sighting_index import (  # noqa: E402
+    SightingCube,
+    SightingIndex,
+    month_number,
+)
+
+
+def random_points(rng, size):
+    # Clustered around a few centers so cells and rings share points.
+    centers = np.array([[45.5, -122.6], [47.6, -122.3], [40.0, -105.0]])
+    picked = centers[rng.integers(0, len(centers), size)]
+    latitudes, longitudes = (
+        picked + rng.normal(scale=0.3, size=picked.shape)
+    ).T
+    dates = np.datetime64("2015-01-01") + rng.integers(0, 3 * 365, size)
+    return dates, latitudes, longitudes
+
+
+def test_trailing_counts_match_brute_force():
+    from h3 import h3
+
+    rng = np.random.default_rng(0)
+    resolution, window_months = 4, 6
+    dates, latitudes, longitudes = random_points(rng, 500)
+    cube = SightingCube.from_points(dates, latitudes, longitudes, resolution)
+    query_dates, query_latitudes, query_longitudes = random_points(rng, 200)
+
+    counts = cube.trailing_counts(
+        query_dates, query_latitudes, query_longitudes, window_months
+    )
+
+    cells = [
+        h3.geo_to_h3(latitude, longitude, resolution)
+        for latitude, longitude in zip(latitudes, longitudes)
+    ]
+    months = month_number(dates)
+    expected = [
+        sum(
+            cell == h3.geo_to_h3(latitude, longitude, resolution)
+            and month - window_months <= point_month < month
+            for cell, point_month in zip(cells, months)
+        )
+        for latitude, longitude, month in zip(
+            query_latitudes, query_longitudes, month_number(query_dates)
+        )
+    ]
+    assert counts.tolist() == expected
+    assert counts.sum() > 0
+
+
+def test_trailing_counts_of_an_empty_cube_are_zero():
+    cube = SightingCube.from_points(
+        np.array([], dtype="datetime64[D]"), [], [], 4
+    )
+
+    counts = cube.trailing_counts(
+        np.array(["2019-06-01"], dtype="datetime64[D]"), [45.5], [-122.6], 6
+    )
+
+    assert counts.tolist() == [0]
+
+
+def test_ring_counts_sum_lookups_over_the_ring():
+    from h3 import h3
+
+    rng = np.random.default_rng(1)
+    resolution, k = 5, 2
+    _, latitudes, longitudes = random_points(rng, 500)
+    index = SightingIndex.from_points(latitudes, longitudes, [resolution])
+    _, query_latitudes, query_longitudes = random_points(rng, 50)
+    cells = to_int(
+        h3.geo_to_h3(latitude, longitude, resolution)
+        for latitude, longitude in zip(query_latitudes, query_longitudes)
+    )
+
+    counts = index.ring_counts(cells, resolution, k)
+
+    expected = [
+        index.lookup(to_int(h3.k_ring(format(cell, "x"), k)), resolution).sum()
+        for cell in cells.tolist()
+    ]
+    assert counts.tolist() == expected
+    assert counts.sum() > 0
+    assert index.ring_counts(cells[:0], resolution, k).size == 0